@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+__author__ = 'Christof Pieloth'
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from packbacker.artifacts import ArtifactCache
+from packbacker.constants import Step
+from packbacker.history import StepHistory
+from packbacker.installer import Installer
+from packbacker.installer import InstallerIndex
+from packbacker.job import Job
+from packbacker.jobparser import JobParser
+from packbacker.manifest import StateManifest
+from packbacker.toolchain import Toolchain
+from packbacker.utils import UtilsUI
+from packbacker.vcs import MirrorCache
+
+
+BENCHMARKS = ('startup', 'parse', 'index', 'execute')
+
+PLUGIN_TEMPLATE = '''__author__ = 'PackBacker Benchmark'
+
+from packbacker.constants import Parameter
+from packbacker.errors import ParameterError
+from packbacker.installer import Installer
+
+
+class Bench{n}(Installer):
+    """Synthetic installer {n}."""
+
+    def __init__(self):
+        Installer.__init__(self, 'bench{n}', 'Benchmark installer {n}')
+
+    @classmethod
+    def instance(cls, params):
+        installer = Bench{n}()
+        if Parameter.DEST_DIR not in params:
+            raise ParameterError(Parameter.DEST_DIR + ' parameter is missing!')
+        installer.arg_dest = params[Parameter.DEST_DIR]
+        return installer
+
+    @classmethod
+    def prototype(cls):
+        return Bench{n}()
+
+    def _fetch(self):
+        return True
+'''
+
+GIT_PLUGIN = '''__author__ = 'PackBacker Benchmark'
+
+import os
+import sys
+
+from packbacker.constants import Parameter
+from packbacker.constants import Step
+from packbacker.installer import Installer
+from packbacker.vcs import Git
+
+
+class BenchGit(Installer):
+    """Clones a local repository and simulates a compile step."""
+
+    REPO_FOLDER = 'repo'
+
+    def __init__(self):
+        Installer.__init__(self, 'benchgit', 'Benchmark git installer')
+        self.arg_repo = None
+        self.arg_work = 0
+
+    @classmethod
+    def instance(cls, params):
+        installer = BenchGit()
+        installer.arg_dest = params[Parameter.DEST_DIR]
+        installer.arg_version = params.get(Parameter.VERSION, 'master')
+        installer.arg_repo = params['repo']
+        installer.arg_work = int(params.get('work', 0))
+        return installer
+
+    @classmethod
+    def prototype(cls):
+        return BenchGit()
+
+    def _fetch(self):
+        success = self._step(Step.DOWNLOAD, 'Download ' + self.name,
+                             lambda ctx: Git.clone(ctx, self.arg_repo, ctx.path(self.REPO_FOLDER)) or True)
+        return success and self._step(Step.INITIALIZE, 'Initialize ' + self.name, lambda ctx: ctx.check(
+            ['git', 'checkout', '--quiet', self.arg_version], cwd=self.REPO_FOLDER) or True)
+
+    def _build(self):
+        work = 'sum(i * i for i in range(' + str(self.arg_work) + '))'
+        return self._step(Step.COMPILE, 'Compile ' + self.name,
+                          lambda ctx: ctx.check([sys.executable, '-c', work]) or True)
+'''
+
+
+class Generator(object):
+    """Creates the inputs of the benchmarks."""
+
+    def __init__(self, base_dir):
+        self._base_dir = base_dir
+
+    def job_file(self, lines, includes=0):
+        """Job file with lines installer lines, which are distributed to includes included files."""
+        names = ['cxxtest', 'eigen3', 'pcl', 'mne-cpp', 'ftbuffer']
+        files = [os.path.join(self._base_dir, 'job-' + str(lines) + '.pb')]
+        files += [os.path.join(self._base_dir, 'include-' + str(i) + '.pb') for i in range(includes)]
+        fds = [open(f, 'w') for f in files]
+        try:
+            for f in files[1:]:
+                fds[0].write('include ' + os.path.basename(f) + '\n')
+            for i in range(lines):
+                fd = fds[i % len(fds)]
+                if i % 10 == 0:
+                    fd.write('# Comment ' + str(i) + '\n')
+                fd.write(names[i % len(names)] + ': dest_dir=' + os.path.join(self._base_dir, 'dest', str(i)) +
+                         '; version=' + str(i) + '; steps=download,initialize; fetch=shallow\n')
+        finally:
+            for fd in fds:
+                fd.close()
+        return files[0]
+
+    def plugin_dir(self, plugins):
+        """Folder with synthetic installer plugins."""
+        path = os.path.join(self._base_dir, 'plugins-' + str(plugins))
+        os.makedirs(path, exist_ok=True)
+        for n in range(plugins):
+            with open(os.path.join(path, 'bench' + str(n) + '.py'), 'w') as fd:
+                fd.write(PLUGIN_TEMPLATE.format(n=n))
+        with open(os.path.join(path, 'benchgit.py'), 'w') as fd:
+            fd.write(GIT_PLUGIN)
+        return path
+
+    def git_repository(self, name, commits, files, file_size):
+        """Local bare git repository with commits, each modifies files files with file_size bytes."""
+        bare = os.path.join(self._base_dir, name + '.git')
+        work = os.path.join(self._base_dir, name + '-work')
+        env = dict(os.environ, GIT_AUTHOR_NAME='bench', GIT_AUTHOR_EMAIL='bench@localhost',
+                   GIT_COMMITTER_NAME='bench', GIT_COMMITTER_EMAIL='bench@localhost')
+        subprocess.check_call(['git', 'init', '--quiet', work])
+        for c in range(commits):
+            for f in range(files):
+                with open(os.path.join(work, 'file' + str(f) + '.txt'), 'wb') as fd:
+                    fd.write(os.urandom(file_size // 2).hex().encode('ascii'))
+            subprocess.check_call(['git', 'add', '--all'], cwd=work)
+            subprocess.check_call(['git', 'commit', '--quiet', '-m', 'Commit ' + str(c)], cwd=work, env=env)
+        subprocess.check_call(['git', 'tag', 'v1'], cwd=work)
+        subprocess.check_call(['git', 'clone', '--quiet', '--bare', work, bare])
+        shutil.rmtree(work)
+        return bare
+
+
+class Benchmark(object):
+    """Executes and prints the benchmarks."""
+
+    def __init__(self, args, base_dir, output):
+        self._args = args
+        self._base_dir = base_dir
+        self._output = output
+        self._generator = Generator(base_dir)
+
+    def report(self, benchmark, params, times):
+        result = {
+            'benchmark': benchmark,
+            'params': params,
+            'runs': len(times),
+            'min': round(min(times), 6),
+            'median': round(statistics.median(times), 6),
+            'max': round(max(times), 6),
+        }
+        self._output.write(json.dumps(result, sort_keys=True) + '\n')
+        self._output.flush()
+
+    def measure(self, function, setup=None):
+        """Returns the wall-clock times of args.repeat calls of function, setup is called before each call."""
+        times = []
+        for _ in range(self._args.repeat):
+            if setup:
+                setup()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                function()
+                times.append(time.perf_counter() - start)
+        return times
+
+    def startup(self):
+        cmd = [sys.executable, os.path.join(ROOT_DIR, 'packbacker.py'), '--help']
+        times = self.measure(lambda: subprocess.check_call(cmd, stdout=subprocess.DEVNULL))
+        self.report('startup', {}, times)
+
+    def parse(self):
+        lines = self._args.job_lines
+        includes = self._args.job_includes
+        fname = self._generator.job_file(lines, includes)
+        params = {'lines': lines, 'includes': includes}
+        self.report('parse.jobparser', params, self.measure(lambda: JobParser().parse(fname)))
+        self.report('parse.read_job', params, self.measure(lambda: Job.read_job(fname)))
+
+    def index(self):
+        plugins = self._args.plugins
+        path = self._generator.plugin_dir(plugins)
+        params = {'plugins': plugins}
+
+        def unload():
+            for name in list(sys.modules):
+                if name.startswith('packbacker.installers.bench'):
+                    del sys.modules[name]
+
+        def cold():
+            if os.path.exists(InstallerIndex.path):
+                os.remove(InstallerIndex.path)
+            unload()
+
+        # Scans and imports all files.
+        self.report('index.cold', params, self.measure(lambda: InstallerIndex(path), cold))
+        # Reads the cached index, no imports.
+        self.report('index.warm', params, self.measure(lambda: InstallerIndex(path), unload))
+        # Cached index, imports all installers.
+        self.report('index.load_prototypes', params, self.measure(lambda: Installer.load_prototypes(path), unload))
+
+    def execute(self):
+        a = self._args
+        repo = self._generator.git_repository('upstream', a.repo_commits, a.repo_files, a.repo_file_size)
+        index = InstallerIndex(self._generator.plugin_dir(0))
+        prototype = index.prototype('benchgit')
+        dest_root = os.path.join(self._base_dir, 'execute')
+        params = {'installers': a.installers, 'commits': a.repo_commits, 'files': a.repo_files,
+                  'file_size': a.repo_file_size, 'work': a.compile_work}
+
+        def create_job():
+            job = Job()
+            for i in range(a.installers):
+                installer = prototype.instance({'dest_dir': os.path.join(dest_root, str(i)), 'version': 'v1',
+                                                'repo': 'file://' + repo, 'work': str(a.compile_work)})
+                installer.arg_steps = list(Step.ALL)
+                job.add_installer(installer)
+            return job
+
+        def clean():
+            shutil.rmtree(dest_root, ignore_errors=True)
+            shutil.rmtree(MirrorCache.path, ignore_errors=True)
+
+        for mode, workers, fetch_workers in [('sequential', 1, 0), ('concurrent', a.workers, 0),
+                                             ('pipelined', 1, a.workers)]:
+            def run():
+                if create_job().execute(workers, fetch_workers) != 0:
+                    raise RuntimeError('Job failed in mode: ' + mode)
+            mode_params = dict(params, workers=workers, fetch_workers=fetch_workers)
+            self.report('execute.' + mode, mode_params, self.measure(run, clean))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.description = 'Benchmarks of PackBacker: startup, job parsing, installer index and job execution.\n' \
+                         'All inputs are generated, i.e. job files, installer plugins and local git repositories.\n' \
+                         'Each result is printed as one JSON object per line, e.g. for regression tracking.'
+    parser.formatter_class = argparse.RawTextHelpFormatter
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                        help='Benchmarks to execute: ' + ', '.join(BENCHMARKS) + ' (default: all).')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per benchmark (default: %(default)s).')
+    parser.add_argument('--job-lines', type=int, default=5000, help='Lines of the job file (default: %(default)s).')
+    parser.add_argument('--job-includes', type=int, default=10,
+                        help='Included job files (default: %(default)s).')
+    parser.add_argument('--plugins', type=int, default=200, help='Installer plugins (default: %(default)s).')
+    parser.add_argument('--installers', type=int, default=4,
+                        help='Installers of the executed job (default: %(default)s).')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Workers of the concurrent and pipelined execution (default: %(default)s).')
+    parser.add_argument('--repo-commits', type=int, default=20,
+                        help='Commits of the generated git repository (default: %(default)s).')
+    parser.add_argument('--repo-files', type=int, default=50,
+                        help='Files changed by each commit (default: %(default)s).')
+    parser.add_argument('--repo-file-size', type=int, default=4096,
+                        help='Size of each file in bytes (default: %(default)s).')
+    parser.add_argument('--compile-work', type=int, default=2000000,
+                        help='Loop iterations of the simulated compile step (default: %(default)s).')
+    parser.add_argument('--output', help='Appends the results to this file instead of printing them.')
+    parser.add_argument('--keep', action='store_true', help='Keeps the generated inputs.')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+
+    base_dir = tempfile.mkdtemp(prefix='packbacker-benchmark-')
+    # Isolates the benchmarks from the caches and settings of the user.
+    UtilsUI.interactive = False
+    MirrorCache.path = os.path.join(base_dir, 'cache', 'mirrors')
+    ArtifactCache.enabled = False
+    StateManifest.enabled = False
+    StepHistory.enabled = False
+    InstallerIndex.path = os.path.join(base_dir, 'cache', 'installer-index.json')
+    Toolchain.path = os.path.join(base_dir, 'cache', 'toolchain.json')
+
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        environment = {'benchmark': 'environment', 'python': platform.python_version(),
+                       'platform': platform.platform(), 'cpus': os.cpu_count(),
+                       'git': subprocess.check_output(['git', '--version']).decode('utf-8').strip()}
+        output.write(json.dumps(environment, sort_keys=True) + '\n')
+        benchmark = Benchmark(args, base_dir, output)
+        for name in BENCHMARKS:
+            if name in args.benchmarks:
+                getattr(benchmark, name)()
+    finally:
+        if args.output:
+            output.close()
+        if args.keep:
+            print('Generated inputs: ' + base_dir, file=sys.stderr)
+        else:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
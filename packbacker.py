@@ -4,11 +4,24 @@ __author__ = 'Christof Pieloth'
 
 import argparse
 from argparse import RawTextHelpFormatter
+import os
 import signal
 import sys
 
+from packbacker.artifacts import ArtifactCache
+from packbacker.ccache import CompilerCache
+from packbacker.cmake import CMake
+from packbacker.command import Command
+from packbacker.errors import ParameterError
 from packbacker.job import Job
+from packbacker.lockfile import Lockfile
+from packbacker.manifest import StateManifest
+from packbacker.parallelism import Parallelism
+from packbacker.progress import Progress
+from packbacker.remote import Worker
+from packbacker.trace import Trace
 from packbacker.utils import UtilsUI
+from packbacker.vcs import MirrorCache
 
 
 def sigint_handler(signum, frame):
@@ -22,21 +35,112 @@ def main():
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
     parser.name = 'PackBacker'
     parser.description = 'PackBacker is a light tool to download and install 3rd party libraries.'
-    parser.add_argument("job", help="Job file.")
+    parser.add_argument("job", nargs="?", help="Job file.")
+    parser.add_argument("-b", "--batch", action="store_true",
+                        help="Do not ask any questions. Executes all steps except system-wide installations,\n"
+                             "use the steps parameter in the job file to select the steps.")
+    parser.add_argument("--mirror-dir", default=MirrorCache.path,
+                        help="Folder for the local mirrors of git and hg repositories (default: %(default)s).")
+    parser.add_argument("--no-mirror", action="store_true",
+                        help="Clone directly from the remote repositories without using local mirrors.")
+    parser.add_argument("--artifact-dir", default=ArtifactCache.path,
+                        help="Folder for the cache of build outputs (default: %(default)s).")
+    parser.add_argument("--artifact-size", type=float, default=ArtifactCache.max_size / 1024 ** 3,
+                        help="Maximum size of the build output cache in GiB (default: %(default)s).")
+    parser.add_argument("--no-artifacts", action="store_true",
+                        help="Always configure and compile, do not use or fill the build output cache.")
+    parser.add_argument("--compiler-cache", choices=CompilerCache.ALL, default=CompilerCache.default,
+                        help="Compiler cache for installers without compiler_cache parameter (default: %(default)s).")
+    parser.add_argument("--compiler-cache-dir",
+                        help="Folder of the compiler cache (default: folder of ccache or sccache).")
+    parser.add_argument("--no-configure-cache", action="store_true",
+                        help="Do not seed CMake configure runs with the cached results of previous configure checks.")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="Number of parallel compile jobs, shared by all installers\n"
+                             "(default: derived from CPUs, CPU quota and free memory).")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Execute all steps, even if they are already done in the destination folder.")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Maximum number of installers, which are executed concurrently (default: 1).")
+    parser.add_argument("--fetch-workers", type=int, default=0,
+                        help="Downloads the sources in a separate pool of workers, while other installers compile\n"
+                             "(default: 0, each installer downloads and compiles in one go).")
+    parser.add_argument("--timeout", type=float, default=0,
+                        help="Timeout in seconds of each step for installers without timeout parameter\n"
+                             "(default: no timeout).")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Prints the output of the commands, which is always written to the log of the installer.")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="Prints the messages of the installers as is, instead of a status line per installer\n"
+                             "on a terminal or lines prefixed with the installer otherwise.")
+    parser.add_argument("--worker", metavar="[HOST:]PORT",
+                        help="Starts a worker, which executes installers for a coordinator (job file is not used).")
+    parser.add_argument("--remote", metavar="HOST:PORT[,HOST:PORT...]",
+                        help="Executes the installers on the workers instead of this machine.")
+    parser.add_argument("--token", default=os.environ.get('PACKBACKER_TOKEN'),
+                        help="Shared secret of coordinator and workers (default: $PACKBACKER_TOKEN).")
+    parser.add_argument("--lock", action="store_true",
+                        help="Resolves the version of each installer to a commit ID and writes the lockfile\n"
+                             "<job file>.lock, which is used by the following runs.")
+    parser.add_argument("--plan", action="store_true",
+                        help="Prints the steps, which would be executed, and their estimated durations.")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Writes the duration of all installations and steps to a trace-event file,\n"
+                             "e.g. for chrome://tracing or https://ui.perfetto.dev.")
     parser.epilog = 'PackBacker  Copyright (C) 2014  Christof Pieloth\n' \
                     'This program comes with ABSOLUTELY NO WARRANTY; see LICENSE file.\n' \
                     'This is free software, and you are welcome to redistribute it\n' \
                     'under certain conditions; see LICENSE file.'
     args = parser.parse_args()
+    if args.job is None and args.worker is None:
+        parser.error('the following arguments are required: job')
+    if args.batch:
+        UtilsUI.interactive = False
+    MirrorCache.path = os.path.expanduser(args.mirror_dir)
+    MirrorCache.enabled = not args.no_mirror
+    ArtifactCache.path = os.path.expanduser(args.artifact_dir)
+    ArtifactCache.max_size = int(args.artifact_size * 1024 ** 3)
+    ArtifactCache.enabled = not args.no_artifacts
+    StateManifest.enabled = not args.no_resume
+    Parallelism.jobs = args.jobs if args.jobs > 0 else None
+    CompilerCache.default = args.compiler_cache
+    if args.compiler_cache_dir:
+        CompilerCache.path = os.path.expanduser(args.compiler_cache_dir)
+    CMake.enabled = not args.no_configure_cache
+    Command.timeout = args.timeout if args.timeout > 0 else None
+    Command.verbose = args.verbose
+    Progress.enabled = not args.no_progress
+    # The output of verbose commands would scroll the status lines away.
+    Progress.live = sys.stdout.isatty() and not args.verbose
+    Trace.enabled = args.trace is not None
+
+    if args.worker:
+        # A worker does not ask any questions, the coordinator asks before the installation.
+        UtilsUI.interactive = False
+        try:
+            Worker.serve(args.worker, Job.create_installer, args.token)
+        except ParameterError as err:
+            UtilsUI.print_error('Could not start worker: ' + err.msg)
+            return 1
+        return 0
 
     UtilsUI.print('PackBacker started ...')
     # Read job
-    job = Job.read_job(args.job)
+    job = Job.read_job(args.job, lockfile=not args.lock)
 
     # Execute job
     errors = 0
-    if job:
-        errors += job.execute()
+    if job and args.lock:
+        errors += job.lock(Lockfile.fname(args.job))
+    elif job and args.plan:
+        job.plan()
+        return 0
+    elif job and args.remote:
+        errors += job.execute_remote(args.remote.split(','), args.token)
+    elif job:
+        errors += job.execute(args.workers, args.fetch_workers)
+        if args.trace and Trace.write(os.path.expanduser(args.trace)):
+            UtilsUI.print('Trace written: ' + args.trace)
     else:
         UtilsUI.print_error('Could not create job. Cancel installations!')
         errors += 1
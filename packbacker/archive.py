@@ -0,0 +1,97 @@
+__author__ = 'Christof Pieloth'
+
+import hashlib
+import logging
+import os
+import shutil
+import tarfile
+import urllib.error
+import urllib.request
+import zipfile
+
+from packbacker.destination import Staging
+from packbacker.errors import ArchiveError
+from packbacker.utils import UtilsUI
+
+
+class Archive(object):
+    """Release archives (tar or zip) as alternative to a VCS clone, e.g. for header-only libraries."""
+
+    log = logging.getLogger(__name__)
+
+    CHUNK_SIZE = 1024 * 1024  # bytes
+    TIMEOUT = 60  # seconds without data from the server
+
+    @staticmethod
+    def fetch(url, dest_dir, sha256):
+        """
+        Downloads the archive, verifies its SHA-256 and extracts it to dest_dir.
+        A single top-level folder of the archive is omitted. Raises an ArchiveError on errors.
+        """
+        if not sha256:
+            raise ArchiveError('No SHA-256 for ' + url + ', the archive can not be verified')
+        tmp_fname = dest_dir + '.download-' + str(os.getpid())
+        tmp_dir = dest_dir + '.extract-' + str(os.getpid())
+        try:
+            digest = Archive.download(url, tmp_fname)
+            if digest != sha256.lower():
+                raise ArchiveError('Checksum mismatch of ' + url + ': expected ' + sha256 + ', got ' + digest)
+            Archive.extract(tmp_fname, tmp_dir)
+
+            entries = os.listdir(tmp_dir)
+            content_dir = tmp_dir
+            if len(entries) == 1 and os.path.isdir(os.path.join(tmp_dir, entries[0])):
+                content_dir = os.path.join(tmp_dir, entries[0])
+            # Like a clone, an existing folder is not overwritten.
+            Staging.publish(dest_dir, lambda path: os.rename(content_dir, path))
+        except (IOError, OSError) as err:
+            raise ArchiveError('Could not fetch ' + url + ': ' + str(err))
+        finally:
+            if os.path.exists(tmp_fname):
+                os.remove(tmp_fname)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def download(url, fname):
+        """Streams the URL (http, https or file) to fname and returns the SHA-256 hex digest of the content."""
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with urllib.request.urlopen(url, timeout=Archive.TIMEOUT) as response, open(fname, 'wb') as fd:
+                for chunk in iter(lambda: response.read(Archive.CHUNK_SIZE), b''):
+                    sha.update(chunk)
+                    fd.write(chunk)
+                    size += len(chunk)
+        except (urllib.error.URLError, ValueError) as err:
+            raise ArchiveError('Could not download ' + url + ': ' + str(err))
+        UtilsUI.print('Downloaded ' + url + ': ' + str(size // 1024) + ' KiB')
+        return sha.hexdigest()
+
+    @staticmethod
+    def extract(fname, dest_dir):
+        """Extracts a tar (optionally compressed) or zip archive, members outside of dest_dir are rejected."""
+        try:
+            if zipfile.is_zipfile(fname):
+                with zipfile.ZipFile(fname) as archive:
+                    archive.extractall(dest_dir)
+            else:
+                with tarfile.open(fname, 'r:*') as archive:
+                    if hasattr(tarfile, 'data_filter'):
+                        archive.extractall(dest_dir, filter='data')
+                    else:
+                        Archive.__check_members(archive, dest_dir)
+                        archive.extractall(dest_dir)
+        except (tarfile.TarError, zipfile.BadZipFile) as err:
+            raise ArchiveError('Could not extract ' + fname + ': ' + str(err))
+
+    @staticmethod
+    def __check_members(archive, dest_dir):
+        root = os.path.realpath(dest_dir)
+        for member in archive.getmembers():
+            path = os.path.realpath(os.path.join(root, member.name))
+            if path != root and not path.startswith(root + os.sep):
+                raise ArchiveError('Archive member outside of destination: ' + member.name)
+            if member.issym() or member.islnk():
+                target = os.path.realpath(os.path.join(os.path.dirname(path), member.linkname))
+                if not target.startswith(root + os.sep):
+                    raise ArchiveError('Archive link outside of destination: ' + member.name)
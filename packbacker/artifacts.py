@@ -0,0 +1,129 @@
+__author__ = 'Christof Pieloth'
+
+import logging
+import os
+import tarfile
+import threading
+
+from packbacker.archive import Archive
+from packbacker.errors import ArchiveError
+from packbacker.utils import Utils
+from packbacker.utils import UtilsUI
+
+
+class ArtifactCache(object):
+    """
+    Cache of build outputs. An artifact is keyed by a hash of all inputs of the build,
+    the least recently used artifacts are removed if the cache exceeds its size.
+    """
+
+    log = logging.getLogger(__name__)
+
+    enabled = True
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'packbacker', 'artifacts')
+    max_size = 10 * 1024 ** 3  # bytes
+
+    hits = 0
+    misses = 0
+
+    SUFFIX = '.tar.gz'
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def key(*inputs):
+        """Returns the key for the inputs of a build, e.g. name, version, options and compiler."""
+        return Utils.digest(*inputs)
+
+    @staticmethod
+    def artifact_file(key):
+        return os.path.join(ArtifactCache.path, key + ArtifactCache.SUFFIX)
+
+    @staticmethod
+    def contains(key):
+        """Checks if the cache is enabled and contains the key."""
+        return ArtifactCache.enabled and os.path.isfile(ArtifactCache.artifact_file(key))
+
+    @staticmethod
+    def restore(key, base_dir):
+        """Extracts the artifact into base_dir. Returns False if the cache is disabled or does not contain the key."""
+        if not ArtifactCache.enabled:
+            return False
+
+        fname = ArtifactCache.artifact_file(key)
+        try:
+            # The cache is shared, members outside of base_dir are rejected.
+            Archive.extract(fname, base_dir)
+        except (IOError, ArchiveError) as err:
+            if os.path.exists(fname):
+                ArtifactCache.log.warning('Could not restore artifact ' + fname + ': ' + str(err))
+            ArtifactCache.__count(hit=False)
+            return False
+
+        # Updates the modification time, which is used to remove the least recently used artifacts.
+        os.utime(fname, None)
+        ArtifactCache.__count(hit=True)
+        UtilsUI.print('Restored build from artifact cache: ' + fname)
+        return True
+
+    @staticmethod
+    def store(key, base_dir, paths):
+        """Packs the paths, relative to base_dir, as artifact and removes old artifacts if the cache is full."""
+        if not ArtifactCache.enabled:
+            return False
+
+        fname = ArtifactCache.artifact_file(key)
+        tmp_fname = fname + '.tmp-' + str(os.getpid()) + '-' + str(threading.get_ident())
+        try:
+            os.makedirs(ArtifactCache.path, exist_ok=True)
+            with tarfile.open(tmp_fname, 'w:gz', compresslevel=1) as tar:
+                for p in paths:
+                    tar.add(os.path.join(base_dir, p), arcname=p)
+            os.replace(tmp_fname, fname)
+        except (IOError, OSError, tarfile.TarError) as err:
+            ArtifactCache.log.warning('Could not store artifact ' + fname + ': ' + str(err))
+            if os.path.exists(tmp_fname):
+                os.remove(tmp_fname)
+            return False
+
+        ArtifactCache.log.info('Stored artifact: ' + fname)
+        ArtifactCache.evict()
+        return True
+
+    @staticmethod
+    def evict():
+        """Removes the least recently used artifacts until the cache does not exceed max_size."""
+        with ArtifactCache._lock:
+            artifacts = []
+            for fname in os.listdir(ArtifactCache.path):
+                if not fname.endswith(ArtifactCache.SUFFIX):
+                    continue
+                st = os.stat(os.path.join(ArtifactCache.path, fname))
+                artifacts.append((st.st_mtime, st.st_size, fname))
+
+            size = sum(a[1] for a in artifacts)
+            for mtime, fsize, fname in sorted(artifacts):
+                if size <= ArtifactCache.max_size:
+                    break
+                ArtifactCache.log.info('Removing least recently used artifact: ' + fname)
+                try:
+                    os.remove(os.path.join(ArtifactCache.path, fname))
+                except OSError:
+                    continue
+                size -= fsize
+
+    @staticmethod
+    def print_statistics():
+        if ArtifactCache.hits + ArtifactCache.misses == 0:
+            return
+        UtilsUI.print('Artifact cache ' + ArtifactCache.path + ': ' + str(ArtifactCache.hits) + ' hits, ' +
+                      str(ArtifactCache.misses) + ' misses')
+
+    @staticmethod
+    def __count(hit):
+        with ArtifactCache._lock:
+            if hit:
+                ArtifactCache.hits += 1
+            else:
+                ArtifactCache.misses += 1
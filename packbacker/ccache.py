@@ -0,0 +1,174 @@
+__author__ = 'Christof Pieloth'
+
+import json
+import logging
+import os
+import re
+import subprocess
+
+from packbacker.toolchain import Toolchain
+from packbacker.utils import UtilsUI
+
+
+class CompilerCache(object):
+    """
+    Compiler cache (ccache or sccache with local disk storage), which is used as launcher of the compilers.
+    A disabled instance returns no options and leaves the commands unchanged.
+    """
+
+    log = logging.getLogger(__name__)
+
+    CCACHE = 'ccache'
+    SCCACHE = 'sccache'
+    NONE = 'none'
+
+    ALL = (CCACHE, SCCACHE, NONE)
+
+    # Compiler cache for all installers without compiler_cache parameter.
+    default = NONE
+    # Cache folder, None for the default of the tool.
+    path = None
+
+    # Default cache folders of the tools, which are queried once.
+    _folders = {}
+    # Statistics of the tools at the start of a job with concurrent compile steps, see begin_job().
+    _job_statistics = None
+
+    def __init__(self, tool):
+        self._tool = tool
+
+    @property
+    def tool(self):
+        return self._tool
+
+    @property
+    def enabled(self):
+        return self._tool != CompilerCache.NONE
+
+    @staticmethod
+    def tool_for(installer):
+        """Returns the name of the compiler cache, which is configured for the installer."""
+        return installer.arg_compiler_cache or CompilerCache.default
+
+    @staticmethod
+    def for_installer(installer):
+        """Returns the compiler cache for the installer, which is disabled if the tool is not found."""
+        tool = CompilerCache.tool_for(installer)
+        if tool != CompilerCache.NONE and Toolchain.find(tool) is None:
+            CompilerCache.log.warning(tool + ' not found, compiling without compiler cache: ' + installer.name)
+            tool = CompilerCache.NONE
+        return CompilerCache(tool)
+
+    def environment(self):
+        """Returns the environment for the compile commands, None to use the environment of this process."""
+        if not self.enabled or CompilerCache.path is None:
+            return None
+        env = dict(os.environ)
+        if self._tool == CompilerCache.CCACHE:
+            env['CCACHE_DIR'] = CompilerCache.path
+        else:
+            env['SCCACHE_DIR'] = CompilerCache.path
+        return env
+
+    def cmake_options(self):
+        if not self.enabled:
+            return []
+        return ['-DCMAKE_C_COMPILER_LAUNCHER=' + self._tool, '-DCMAKE_CXX_COMPILER_LAUNCHER=' + self._tool]
+
+    def launch(self, compiler):
+        """Returns the compiler command with the launcher, e.g. 'ccache g++'."""
+        if not self.enabled:
+            return compiler
+        return self._tool + ' ' + compiler
+
+    def statistics(self):
+        """Returns the number of cache hits and misses so far, None if disabled or unknown."""
+        if not self.enabled:
+            return None
+        try:
+            if self._tool == CompilerCache.CCACHE:
+                return self.__ccache_statistics()
+            else:
+                return self.__sccache_statistics()
+        except (OSError, KeyError, ValueError, subprocess.CalledProcessError) as err:
+            CompilerCache.log.warning('Could not read statistics of ' + self._tool + ': ' + str(err))
+            return None
+
+    def print_statistics(self, before):
+        """
+        Prints the hits and misses since the statistics before, e.g. of a compile step.
+        Nothing is printed while the statistics are printed per job, see begin_job().
+        """
+        if CompilerCache._job_statistics is None:
+            self.__print_statistics(before, '')
+
+    @staticmethod
+    def begin_job(installers):
+        """
+        Records the statistics at the start of a job, whose compile steps run at the same time.
+        The counters of a cache folder are shared, so the statistics are printed once per job, see end_job().
+        """
+        stats = {}
+        for tool in sorted(set(CompilerCache.tool_for(i) for i in installers)):
+            if tool != CompilerCache.NONE and Toolchain.find(tool) is not None:
+                stats[tool] = CompilerCache(tool).statistics()
+        CompilerCache._job_statistics = stats
+
+    @staticmethod
+    def end_job():
+        """Prints the hits and misses of all installers since begin_job()."""
+        stats = CompilerCache._job_statistics
+        CompilerCache._job_statistics = None
+        for tool, before in sorted((stats or {}).items()):
+            CompilerCache(tool).__print_statistics(before, ' of all installers')
+
+    def __print_statistics(self, before, suffix):
+        after = self.statistics()
+        if before is None or after is None:
+            return
+        folder = self.folder()
+        UtilsUI.print(self._tool + (' (' + folder + ')' if folder else '') + ': ' + str(after[0] - before[0]) +
+                      ' hits, ' + str(after[1] - before[1]) + ' misses' + suffix)
+
+    def folder(self):
+        """Returns the cache folder, which is used by the tool, None if disabled or unknown."""
+        if not self.enabled:
+            return None
+        if CompilerCache.path is not None:
+            return CompilerCache.path
+        if self._tool not in CompilerCache._folders:
+            try:
+                if self._tool == CompilerCache.CCACHE:
+                    folder = self.__output([self._tool, '--get-config', 'cache_dir']).strip()
+                else:
+                    # E.g. 'Cache location                  Local disk: "/home/user/.cache/sccache"'
+                    match = re.search(r'^Cache location\s+Local disk: "(.*)"$',
+                                      self.__output([self._tool, '--show-stats']), re.MULTILINE)
+                    folder = match.group(1) if match else None
+            except (OSError, subprocess.CalledProcessError) as err:
+                CompilerCache.log.warning('Could not read cache folder of ' + self._tool + ': ' + str(err))
+                folder = None
+            CompilerCache._folders[self._tool] = folder or None
+        return CompilerCache._folders[self._tool]
+
+    def __ccache_statistics(self):
+        try:
+            out = self.__output([self._tool, '--print-stats'])
+            stats = dict((k, int(v)) for k, v in re.findall(r'^(\w+)\t(\d+)$', out, re.MULTILINE))
+            return (stats.get('direct_cache_hit', 0) + stats.get('preprocessed_cache_hit', 0),
+                    stats.get('cache_miss', 0))
+        except subprocess.CalledProcessError:
+            # ccache < 3.7
+            out = self.__output([self._tool, '--show-stats'])
+            hits = sum(int(n) for n in re.findall(r'^cache hit \(\w+\)\s+(\d+)', out, re.MULTILINE))
+            misses = sum(int(n) for n in re.findall(r'^cache miss\s+(\d+)', out, re.MULTILINE))
+            return hits, misses
+
+    def __sccache_statistics(self):
+        stats = json.loads(self.__output([self._tool, '--show-stats', '--stats-format=json']))['stats']
+        return (sum(stats['cache_hits']['counts'].values()),
+                sum(stats['cache_misses']['counts'].values()))
+
+    def __output(self, cmd):
+        out = subprocess.check_output(cmd, env=self.environment(), stderr=subprocess.DEVNULL)
+        return out.decode('utf-8', 'replace')
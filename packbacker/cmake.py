@@ -0,0 +1,153 @@
+__author__ = 'Christof Pieloth'
+
+import logging
+import os
+import re
+import shutil
+
+from packbacker.errors import ParameterError
+from packbacker.parallelism import Make
+from packbacker.parallelism import Ninja
+from packbacker.toolchain import Toolchain
+from packbacker.utils import Utils
+from packbacker.utils import UtilsUI
+
+
+class CMake(object):
+    """
+    Configures and builds CMake projects with the Makefile or Ninja generator.
+    The results of the configure checks, e.g. HAVE_STDINT_H, are cached as initial-cache script (cmake -C).
+    A configure in a new build folder is seeded with the script of the same options and toolchain,
+    so the checks are not executed again.
+    """
+
+    log = logging.getLogger(__name__)
+
+    MAKE = 'make'
+    NINJA = 'ninja'
+
+    GENERATORS = (MAKE, NINJA)
+
+    CACHE_FILE = 'CMakeCache.txt'
+
+    # Cache entries with the results of check_include_file(), check_function_exists(), check_type_size() etc.
+    CHECK_ENTRY = re.compile(r'^(CMAKE_)?HAVE_\w+$|^\w+_(COMPILES|COMPILED|RUN|RUNS|EXITCODE)$|^SIZEOF_\w+$')
+
+    enabled = True
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'packbacker', 'cmake')
+
+    _GENERATOR_NAMES = {MAKE: 'Unix Makefiles', NINJA: 'Ninja'}
+
+    @staticmethod
+    def check_generator(generator):
+        """Raises a ParameterError if the generator is unknown."""
+        if generator not in CMake.GENERATORS:
+            raise ParameterError("Unknown generator '" + generator + "', expected one of: " +
+                                 ', '.join(CMake.GENERATORS))
+
+    @staticmethod
+    def parse_options(text):
+        """Returns the options of the text, e.g. '-DBUILD_io=ON -Wno-dev'. Raises a ParameterError."""
+        options = text.split()
+        for o in options:
+            if not o.startswith('-'):
+                raise ParameterError("Invalid cmake option '" + o + "', expected e.g. -DNAME=VALUE")
+        return options
+
+    @staticmethod
+    def merge_options(defaults, overrides):
+        """Returns the defaults, in which a -DNAME=... of the overrides replaces the one with the same name."""
+        def name(option):
+            match = re.match(r'^-D([^:=]+)', option)
+            return match.group(1) if match else None
+
+        names = set(name(o) for o in overrides if name(o))
+        return [o for o in defaults if name(o) not in names] + list(overrides)
+
+    @staticmethod
+    def key(*inputs):
+        """Returns the key of the initial-cache script for the toolchain and the inputs, e.g. installer and options."""
+        compilers = [Toolchain.version(os.environ.get('CC', 'cc')), Toolchain.version(os.environ.get('CXX', 'c++'))]
+        return Utils.digest(Toolchain.version('cmake'), *(compilers + list(inputs)))
+
+    @staticmethod
+    def configure(ctx, source_dir, build_dir, generator, options, key):
+        """
+        Configures the sources in the build folder, which is cleared if it was configured with another generator.
+        key identifies the initial-cache script, see key(). Raises a CommandError if cmake fails.
+        """
+        cache_file = os.path.join(build_dir, CMake.CACHE_FILE)
+        previous = CMake.generator_of(build_dir)
+        if previous is not None and previous != CMake._GENERATOR_NAMES[generator]:
+            UtilsUI.print('Clearing build folder, it was configured for ' + previous + ': ' + build_dir)
+            shutil.rmtree(build_dir)
+        os.makedirs(build_dir, exist_ok=True)
+
+        cmd = ['cmake', '-G', CMake._GENERATOR_NAMES[generator]] + list(options)
+        script = CMake.__script(key)
+        if CMake.enabled and not os.path.exists(cache_file) and os.path.exists(script):
+            UtilsUI.print('Seeding configure checks from ' + script)
+            cmd += ['-C', script]
+        ctx.check(cmd + [os.path.abspath(source_dir)], cwd=build_dir)
+
+        if CMake.enabled:
+            CMake.__store(script, cache_file, [os.path.abspath(source_dir), os.path.abspath(build_dir)])
+
+    @staticmethod
+    def build(ctx, build_dir, generator, label):
+        """Builds the configured project with make or ninja. Raises a CommandError on errors."""
+        if generator == CMake.NINJA:
+            Ninja.call(ctx, build_dir, label)
+        else:
+            Make.call(ctx, build_dir, label)
+
+    @staticmethod
+    def install_command(generator):
+        """Returns the command, which installs the project, e.g. with sudo."""
+        return [generator, 'install']
+
+    @staticmethod
+    def generator_of(build_dir):
+        """Returns the name of the generator of the build folder, e.g. 'Ninja', None if it is not configured."""
+        try:
+            with open(os.path.join(build_dir, CMake.CACHE_FILE), 'r') as fd:
+                for line in fd:
+                    if line.startswith('CMAKE_GENERATOR:'):
+                        return line.split('=', 1)[1].strip()
+        except IOError:
+            pass
+        return None
+
+    @staticmethod
+    def __script(key):
+        return os.path.join(CMake.path, key + '.cmake')
+
+    @staticmethod
+    def __store(script, cache_file, folders):
+        """Writes the results of the configure checks, which do not depend on the folders, to the script."""
+        lines = []
+        try:
+            with open(cache_file, 'r') as fd:
+                for line in fd:
+                    match = re.match(r'^([\w.+-]+):INTERNAL=(.*)$', line.rstrip('\n'))
+                    if not match or not CMake.CHECK_ENTRY.match(match.group(1)):
+                        continue
+                    name, value = match.groups()
+                    if any(f in value for f in folders):
+                        continue
+                    value = value.replace('\\', '\\\\').replace('"', '\\"')
+                    lines.append('set(' + name + ' "' + value + '" CACHE INTERNAL "")\n')
+        except IOError as err:
+            CMake.log.warning('Could not read ' + cache_file + ': ' + str(err))
+            return
+
+        tmp_script = script + '.tmp-' + str(os.getpid())
+        try:
+            os.makedirs(CMake.path, exist_ok=True)
+            with open(tmp_script, 'w') as fd:
+                fd.write('# Results of the configure checks, written by PackBacker.\n')
+                fd.writelines(lines)
+            os.replace(tmp_script, script)
+        except (IOError, OSError) as err:
+            CMake.log.warning('Could not write initial cache ' + script + ': ' + str(err))
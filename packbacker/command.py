@@ -0,0 +1,183 @@
+__author__ = 'Christof Pieloth'
+
+import collections
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from packbacker.errors import CommandError
+from packbacker.progress import Progress
+
+
+class CommandLog(object):
+    """
+    Log file for the output of all commands of an installer.
+    Used as context manager, it becomes the log of the commands which are executed by the current thread.
+    The last lines are kept in the progress task of the thread, e.g. for the live view.
+    """
+
+    FOLDER = '.packbacker-logs'
+
+    def __init__(self, name, dest_dir, append=False):
+        self._name = name
+        self._append = append
+        self._fname = os.path.join(dest_dir, CommandLog.FOLDER, name + '.log')
+        self._fd = None
+        self._lock = threading.Lock()
+        self._task = None
+        # Absolute time (time.time()) after which the commands are canceled, None for no limit.
+        self.deadline = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def fname(self):
+        return self._fname
+
+    def __enter__(self):
+        try:
+            os.makedirs(os.path.dirname(self._fname), exist_ok=True)
+            self._fd = open(self._fname, 'a' if self._append else 'w')
+        except (IOError, OSError) as err:
+            Command.log.warning('Could not create log file ' + self._fname + ': ' + str(err))
+        Command._local.log = self
+        self._task = Progress.current()
+        if self._task:
+            self._task.log = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Command._local.log = None
+        if self._task:
+            self._task.log = None
+            self._task = None
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+        return False
+
+    def write(self, line):
+        with self._lock:
+            if self._fd:
+                self._fd.write(line)
+                self._fd.flush()
+            if self._task:
+                self._task.append(line)
+
+    def remaining(self):
+        """Seconds until the deadline, None for no limit."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+
+class Command(object):
+    """
+    Executes the commands of the installers.
+    The output is written to the log of the installer, only the last lines are kept for error messages.
+    """
+
+    log = logging.getLogger(__name__)
+
+    TAIL_LINES = 30
+    KILL_DELAY = 5  # seconds between SIGTERM and SIGKILL on timeouts
+
+    # Prints the output of the commands in addition to the log file.
+    verbose = False
+    # Timeout in seconds of a step for installers without timeout parameter, None for no limit.
+    timeout = None
+
+    _local = threading.local()
+
+    @staticmethod
+    def current_log():
+        """Returns the CommandLog of the current thread or None."""
+        return getattr(Command._local, 'log', None)
+
+    @staticmethod
+    def run(args, cwd=None, env=None, timeout=None, pass_fds=(), interactive=False, log=None):
+        """
+        Executes the command (list of arguments) and returns its exit code.
+        Raises a CommandError if the command can not be started or exceeds the timeout (seconds) or the deadline
+        of the step. Interactive commands, e.g. sudo, are connected to the terminal.
+        The output is written to log, by default to the CommandLog of the current thread.
+        """
+        return Command.__execute(args, cwd, env, timeout, pass_fds, interactive, log)[0]
+
+    @staticmethod
+    def check(args, cwd=None, env=None, timeout=None, pass_fds=(), interactive=False, log=None):
+        """Executes the command like run(). Raises a CommandError if the exit code is not 0."""
+        rc, tail = Command.__execute(args, cwd, env, timeout, pass_fds, interactive, log)
+        if rc != 0:
+            raise CommandError("'" + ' '.join(args) + "' failed with exit code " + str(rc), tail)
+
+    @staticmethod
+    def __execute(args, cwd, env, timeout, pass_fds, interactive, cmd_log):
+        cmd_log = cmd_log or Command.current_log()
+        if cmd_log and cmd_log.remaining() is not None:
+            timeout = cmd_log.remaining() if timeout is None else min(timeout, cmd_log.remaining())
+
+        cmd_str = ' '.join(args)
+        Command.log.debug('Executing in ' + str(cwd or os.getcwd()) + ': ' + cmd_str)
+        if cmd_log:
+            cmd_log.write('$ ' + cmd_str + '\n')
+        tail = collections.deque(maxlen=Command.TAIL_LINES)
+
+        try:
+            process = subprocess.Popen(args, cwd=cwd, env=env, pass_fds=pass_fds, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, stdin=None if interactive else subprocess.DEVNULL,
+                                       start_new_session=not interactive)
+        except OSError as err:
+            raise CommandError("Could not execute '" + cmd_str + "': " + str(err))
+
+        reader = threading.Thread(target=Command.__read, args=(process.stdout, cmd_log, tail))
+        reader.daemon = True
+        reader.start()
+        try:
+            rc = process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            Command.__kill(process, interactive)
+            reader.join(1.0)
+            raise CommandError("'" + cmd_str + "' canceled after " + str(round(timeout, 1)) + ' seconds', tail)
+        # Daemons started by the command, e.g. a compiler cache server, may keep the output open.
+        reader.join(1.0)
+        if cmd_log:
+            cmd_log.write('[exit code ' + str(rc) + ']\n')
+        return rc, list(tail)
+
+    @staticmethod
+    def __read(stream, cmd_log, tail):
+        echo = Command.verbose or cmd_log is None
+        prefix = '[' + cmd_log.name + '] ' if cmd_log else ''
+        for raw in iter(stream.readline, b''):
+            line = raw.decode('utf-8', 'replace')
+            tail.append(line.rstrip('\n'))
+            if cmd_log:
+                cmd_log.write(line)
+            if echo:
+                print(prefix + line, end='', flush=True)
+        stream.close()
+
+    @staticmethod
+    def __kill(process, interactive):
+        """Terminates the command and all its child processes, e.g. the compilers of make."""
+        def send(sig):
+            try:
+                if interactive:
+                    os.kill(process.pid, sig)
+                else:
+                    os.killpg(process.pid, sig)
+            except OSError:
+                pass
+
+        send(signal.SIGTERM)
+        try:
+            process.wait(Command.KILL_DELAY)
+        except subprocess.TimeoutExpired:
+            send(signal.SIGKILL)
+            process.wait()
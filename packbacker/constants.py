@@ -7,4 +7,62 @@ class Parameter(object):
     CONFIG_FILE = 'cfg_file'
     DEST_DIR = 'dest_dir'
 
-    VERSION = 'version'
\ No newline at end of file
+    VERSION = 'version'
+    REVISION = 'revision'
+
+    # Release archive
+    ARCHIVE = 'archive'
+    SHA256 = 'sha256'
+
+    # Job control
+    COMPILER_CACHE = 'compiler_cache'
+    DEPENDS = 'depends'
+    FETCH = 'fetch'
+    KEEP = 'keep'
+    STEPS = 'steps'
+    TIMEOUT = 'timeout'
+
+
+class Step(object):
+    """Names of the installation steps, e.g. for the steps parameter in a job file."""
+    DOWNLOAD = 'download'
+    INITIALIZE = 'initialize'
+    CONFIGURE = 'configure'
+    COMPILE = 'compile'
+    INSTALL = 'install'
+
+    ALL = (DOWNLOAD, INITIALIZE, CONFIGURE, COMPILE, INSTALL)
+
+
+class Fetch(object):
+    """Modes to download the sources, e.g. for the fetch parameter in a job file."""
+    CLONE = 'clone'  # Full history
+    SHALLOW = 'shallow'  # Only the revision of the version parameter
+    WORKTREE = 'worktree'  # Checkout of the local mirror, several versions share one download
+    ARCHIVE = 'archive'  # Release archive without VCS, see archive and sha256 parameter
+
+    ALL = (CLONE, SHALLOW, WORKTREE, ARCHIVE)
+
+
+class Keep(object):
+    """Parts of an installation, which are kept after a successful installation, see keep parameter."""
+    HEADERS = 'headers'  # Include files
+    LIBS = 'libs'  # Libraries and the files to use them, e.g. CMake package configurations
+    BUILD = 'build'  # Intermediates of configure and compile, e.g. object files
+    VCS = 'vcs'  # History of the repository, e.g. .git folder
+
+    ALL = (HEADERS, LIBS, BUILD, VCS)
+
+
+class Vcs(object):
+    """Version control systems of the repositories."""
+    GIT = 'git'
+    HG = 'hg'
+
+
+class PlanState(object):
+    """State of a step in the plan of a dry run."""
+    RUN = 'run'
+    DONE = 'done'  # Finished in a previous run with the same inputs
+    SKIP = 'skip'  # Not selected
+    RESTORE = 'restore'  # Outputs of configure and compile are restored from the artifact cache
@@ -0,0 +1,51 @@
+__author__ = 'Christof Pieloth'
+
+import os
+
+from packbacker.command import Command
+
+
+class Context(object):
+    """
+    Execution context of an installer, which is passed to each step and to the helpers executing its commands:
+    working directory, environment and the log file for the output of the commands. Steps use it instead of
+    process-wide state, e.g. os.chdir(), so several installers can be executed in threads of the same process.
+    """
+
+    def __init__(self, cwd, env=None, output=None):
+        self._cwd = os.path.abspath(cwd)
+        self._env = env
+        self._output = output
+
+    @property
+    def cwd(self):
+        """Working directory of the commands, i.e. the destination folder of the installer."""
+        return self._cwd
+
+    @property
+    def env(self):
+        """Environment of the commands, None for the environment of this process."""
+        return self._env
+
+    @property
+    def output(self):
+        """CommandLog for the output of the commands, None to print the output."""
+        return self._output
+
+    def path(self, *paths):
+        """Returns the absolute path of a path relative to the working directory."""
+        return os.path.join(self._cwd, *paths)
+
+    def derive(self, env):
+        """Returns a context with another environment, e.g. for a compiler cache. None keeps the environment."""
+        return Context(self._cwd, env if env is not None else self._env, self._output)
+
+    def run(self, args, cwd=None, env=None, timeout=None, pass_fds=(), interactive=False):
+        """Executes the command like Command.run(), cwd is relative to the working directory."""
+        return Command.run(args, cwd=self.path(cwd) if cwd else self._cwd, env=env if env is not None else self._env,
+                           timeout=timeout, pass_fds=pass_fds, interactive=interactive, log=self._output)
+
+    def check(self, args, cwd=None, env=None, timeout=None, pass_fds=(), interactive=False):
+        """Executes the command like Command.check(), cwd is relative to the working directory."""
+        Command.check(args, cwd=self.path(cwd) if cwd else self._cwd, env=env if env is not None else self._env,
+                      timeout=timeout, pass_fds=pass_fds, interactive=interactive, log=self._output)
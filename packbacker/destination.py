@@ -0,0 +1,112 @@
+__author__ = 'Christof Pieloth'
+
+import fcntl
+import logging
+import os
+import shutil
+import threading
+
+from packbacker.errors import CommandError
+from packbacker.utils import UtilsUI
+
+
+class InstallLock(object):
+    """
+    Advisory lock of an installer in a destination folder, which is shared by several PackBacker processes.
+    A second process waits until the installation is finished and skips the steps, which are already done.
+    """
+
+    log = logging.getLogger(__name__)
+
+    FOLDER = '.packbacker-locks'
+
+    def __init__(self, name, dest_dir):
+        self._name = name
+        self._fname = os.path.join(dest_dir, InstallLock.FOLDER, name + '.lock')
+        self._fd = None
+
+    @property
+    def fname(self):
+        return self._fname
+
+    def __enter__(self):
+        try:
+            os.makedirs(os.path.dirname(self._fname), exist_ok=True)
+            self._fd = os.open(self._fname, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as err:
+            InstallLock.log.warning('Could not create lock file ' + self._fname + ': ' + str(err))
+            return self
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner = os.pread(self._fd, 64, 0).decode('utf-8', 'replace').strip() or 'unknown'
+            UtilsUI.print('Waiting for ' + self._name + ', which is installed by process ' + owner + ' ...')
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, str(os.getpid()).encode('utf-8'), 0)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._fd is not None:
+            os.ftruncate(self._fd, 0)
+            # Closing releases the lock.
+            os.close(self._fd)
+            self._fd = None
+        return False
+
+
+class Staging(object):
+    """Creates folders at a staging path and publishes them with a rename, so nobody sees a half-populated folder."""
+
+    FOLDER = '.packbacker-staging'
+
+    @staticmethod
+    def publish(path, create, move=os.rename):
+        """
+        Calls create(staging_path) and moves the result to path with move(staging_path, path).
+        The staging path is on the same file system, so the rename is atomic.
+        Raises a CommandError if path already exists and is not an empty folder, see replace().
+        """
+        if os.path.exists(path) and (not os.path.isdir(path) or os.listdir(path)):
+            raise CommandError(path + ' already exists, remove it to download it again')
+        staging_path = Staging.__path(path, 'new')
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+        try:
+            create(staging_path)
+            move(staging_path, path)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    @staticmethod
+    def replace(paths, function):
+        """
+        Moves the existing paths aside, e.g. an outdated download, and calls function(), which publishes them again.
+        If function() fails, the new paths are removed and the old ones are restored. Returns the result of function().
+        """
+        moved = []
+        for path in paths:
+            if os.path.lexists(path):
+                old_path = Staging.__path(path, 'old')
+                shutil.rmtree(old_path, ignore_errors=True)
+                os.makedirs(os.path.dirname(old_path), exist_ok=True)
+                os.rename(path, old_path)
+                moved.append((path, old_path))
+        success = False
+        try:
+            success = function()
+        finally:
+            for path, old_path in moved:
+                if success:
+                    shutil.rmtree(old_path, ignore_errors=True)
+                    continue
+                if os.path.lexists(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                os.rename(old_path, path)
+        return success
+
+    @staticmethod
+    def __path(path, kind):
+        parent = os.path.dirname(os.path.abspath(path))
+        return os.path.join(parent, Staging.FOLDER, os.path.basename(path) + '.' + kind + '.' + str(os.getpid()) +
+                            '.' + str(threading.get_ident()))
@@ -10,4 +10,38 @@ class ParameterError(Exception):
         return self._msg
 
     def __str__(self):
-       return repr(self.msg)
\ No newline at end of file
+       return repr(self.msg)
+
+
+class DependencyError(ParameterError):
+    """Missing or cyclic dependencies between the installers of a job."""
+    pass
+
+
+class JobFileError(ParameterError):
+    """Syntax errors in a job file, the message contains the file name and line number."""
+    pass
+
+
+class CommandError(Exception):
+    """A command of an installer failed or timed out, tail contains the last lines of its output."""
+
+    def __init__(self, msg, tail=None):
+        self._msg = msg
+        self._tail = list(tail or [])
+
+    @property
+    def msg(self):
+        return self._msg
+
+    @property
+    def tail(self):
+        return self._tail
+
+    def __str__(self):
+        return self.msg
+
+
+class ArchiveError(CommandError):
+    """Download, checksum verification or extraction of a release archive failed."""
+    pass
@@ -0,0 +1,120 @@
+__author__ = 'Christof Pieloth'
+
+import collections
+import fnmatch
+import logging
+import os
+import threading
+
+from packbacker.utils import UtilsUI
+
+
+class Footprint(object):
+    """
+    Disk usage of the installations and pruning of the files, which are not needed to use an installed dependency,
+    e.g. object files and the history of the repository. See keep parameter.
+    """
+
+    log = logging.getLogger(__name__)
+
+    _entries = collections.OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def size(path):
+        """Returns the disk usage of the file or folder in bytes, hard links are counted once."""
+        inodes = set()
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    st = os.lstat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) not in inodes:
+                    inodes.add((st.st_dev, st.st_ino))
+                    total += st.st_blocks * 512
+        if os.path.isfile(path):
+            total += os.lstat(path).st_blocks * 512
+        return total
+
+    @staticmethod
+    def kept(rel_path, patterns):
+        """Checks if the path or one of its parent folders matches a pattern, e.g. 'pcl/build' or 'pcl/*.h'."""
+        while rel_path:
+            if any(fnmatch.fnmatchcase(rel_path, p) for p in patterns):
+                return True
+            rel_path = os.path.dirname(rel_path)
+        return False
+
+    @staticmethod
+    def prune(dest_dir, outputs, patterns):
+        """
+        Removes all files and folders of the outputs, which do not match the patterns.
+        Outputs and patterns are relative to the destination folder. Returns the removed files.
+        """
+        removed = 0
+        for output in outputs:
+            path = os.path.join(dest_dir, output)
+            if Footprint.kept(output, patterns) or not os.path.lexists(path):
+                continue
+            if not os.path.isdir(path) or os.path.islink(path):
+                os.remove(path)
+                removed += 1
+                continue
+            for root, dirs, files in os.walk(path, topdown=False):
+                rel_root = os.path.relpath(root, dest_dir)
+                for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+                    if not Footprint.kept(os.path.join(rel_root, name), patterns):
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+                if not Footprint.kept(rel_root, patterns) and not os.listdir(root):
+                    os.rmdir(root)
+        return removed
+
+    @staticmethod
+    def reduce(installer, prune=True):
+        """
+        Prunes the outputs of the installer to the parts of its keep parameter and records the disk usage.
+        Without keep parameter or prune, only the disk usage is recorded. Returns False if a file could not be removed.
+        """
+        outputs = [os.path.join(installer.arg_dest, p) for p in installer.outputs()]
+        before = sum(Footprint.size(p) for p in outputs if os.path.lexists(p))
+        if installer.arg_keep is not None and prune:
+            parts = installer.parts()
+            patterns = [p for k in installer.arg_keep for p in parts.get(k, [])]
+            try:
+                removed = Footprint.prune(installer.arg_dest, installer.outputs(), patterns)
+            except OSError as err:
+                Footprint.log.error('Could not prune ' + installer.name + ': ' + str(err))
+                return False
+            Footprint.log.info(installer.name + ': ' + str(removed) + ' files removed, keep=' +
+                               ','.join(installer.arg_keep))
+            after = sum(Footprint.size(p) for p in outputs if os.path.lexists(p))
+        else:
+            after = before
+        with Footprint._lock:
+            Footprint._entries[(installer.name, installer.arg_dest)] = (before - after, after)
+        return True
+
+    @staticmethod
+    def print_statistics():
+        with Footprint._lock:
+            entries = list(Footprint._entries.items())
+        if not entries:
+            return
+        UtilsUI.print('Disk footprint:')
+        for (name, dest_dir), (reclaimed, size) in entries:
+            line = '  ' + name + ' (' + dest_dir + '): ' + Footprint.format_size(size)
+            if reclaimed:
+                line += ', ' + Footprint.format_size(reclaimed) + ' reclaimed'
+            UtilsUI.print(line)
+
+    @staticmethod
+    def format_size(size):
+        """Returns the size in bytes in a readable form, e.g. '1.5 GiB'."""
+        for unit in ('B', 'KiB', 'MiB'):
+            if size < 1024:
+                return str(round(size, 1)) + ' ' + unit
+            size /= 1024.0
+        return str(round(size, 1)) + ' GiB'
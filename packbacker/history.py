@@ -0,0 +1,68 @@
+__author__ = 'Christof Pieloth'
+
+import json
+import logging
+import os
+import threading
+
+
+class StepHistory(object):
+    """Durations of the last executions of each step, e.g. to estimate the duration of a job."""
+
+    log = logging.getLogger(__name__)
+
+    SAMPLES = 10  # durations per step
+
+    enabled = True
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'packbacker', 'step-history.json')
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def key(installer, step, variant=None):
+        """Returns the key of a step, variant distinguishes e.g. the fetch modes of a download."""
+        key = installer + ':' + step
+        if variant:
+            key += ':' + variant
+        return key
+
+    @staticmethod
+    def record(key, seconds):
+        """Adds the duration of a successful execution."""
+        if not StepHistory.enabled:
+            return
+        with StepHistory._lock:
+            history = StepHistory._read()
+            durations = history.setdefault(key, [])
+            durations.append(round(seconds, 3))
+            del durations[:-StepHistory.SAMPLES]
+            StepHistory._write(history)
+
+    @staticmethod
+    def estimate(key):
+        """Returns the median of the recorded durations in seconds, None if the step was never executed."""
+        with StepHistory._lock:
+            durations = sorted(StepHistory._read().get(key, []))
+        if not durations:
+            return None
+        return durations[len(durations) // 2]
+
+    @staticmethod
+    def _read():
+        try:
+            with open(StepHistory.path, 'r') as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write(history):
+        tmp_path = StepHistory.path + '.tmp-' + str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(StepHistory.path), exist_ok=True)
+            with open(tmp_path, 'w') as fd:
+                json.dump(history, fd, indent=2, sort_keys=True)
+            os.replace(tmp_path, StepHistory.path)
+        except (IOError, OSError) as err:
+            StepHistory.log.warning('Could not write step history ' + StepHistory.path + ': ' + str(err))
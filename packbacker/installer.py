@@ -1,22 +1,67 @@
 __author__ = 'Christof Pieloth'
 
+import importlib.util
+import json
 import logging
 import os
+import sys
+import time
 
-from packbacker.pluginloader import BaseClassCondition
-from packbacker.pluginloader import PluginLoader
+from packbacker.artifacts import ArtifactCache
+from packbacker.command import Command
+from packbacker.command import CommandLog
+from packbacker.context import Context
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
+from packbacker.constants import PlanState
+from packbacker.constants import Step
+from packbacker.constants import Vcs
+from packbacker.destination import InstallLock
+from packbacker.destination import Staging
+from packbacker.errors import CommandError
+from packbacker.footprint import Footprint
+from packbacker.history import StepHistory
+from packbacker.manifest import StateManifest
+from packbacker.progress import Progress
+from packbacker.trace import Trace
+from packbacker.utils import Utils
 from packbacker.utils import UtilsUI
+from packbacker.vcs import Git
+from packbacker.vcs import Hg
+from packbacker.vcs import MirrorCache
 
 
 class Installer(object):
     """Abstract installer with default implementations of pre_install and post_install."""
 
+    # Supported download modes, see constants.Fetch.
+    FETCH_MODES = (Fetch.CLONE, Fetch.SHALLOW, Fetch.WORKTREE)
+    # URL of the release archive for fetch=archive, {version} is replaced by the version.
+    ARCHIVE_URL = None
+    # Repository of the sources and its version control system, e.g. to resolve the version for a lockfile.
+    REPO_URL = None
+    VCS = Vcs.GIT
+
     def __init__(self, name, label):
         self.__name = name
         self.__label = label
         self.__log = logging.getLogger(self.__name)
         self.__arg_dest = os.path.expanduser('~')
         self.__arg_version = None
+        self.__arg_revision = None
+        self.__arg_depends = []
+        self.__arg_steps = None
+        self.__arg_fetch = Fetch.CLONE
+        self.__arg_archive = None
+        self.__arg_sha256 = None
+        self.__arg_compiler_cache = None
+        self.__arg_timeout = None
+        self.__arg_keep = None
+        self.__manifest = None
+        self.__stale = False
+        self.__skipped = []
+        self.__plan = None
+        self.__context = None
 
     @property
     def name(self):
@@ -46,40 +91,360 @@ class Installer(object):
     def arg_version(self, version):
         self.__arg_version = version
 
+    @property
+    def arg_revision(self):
+        """Commit ID of the version, e.g. from the lockfile of the job (optional)."""
+        return self.__arg_revision
+
+    @arg_revision.setter
+    def arg_revision(self, revision):
+        self.__arg_revision = revision
+
+    @property
+    def revision(self):
+        """Revision to check out: the pinned commit ID or the version."""
+        return self.__arg_revision or self.__arg_version
+
+    @property
+    def arg_depends(self):
+        """Names of installers, which must be installed before this one (optional)."""
+        return self.__arg_depends
+
+    @arg_depends.setter
+    def arg_depends(self, depends):
+        self.__arg_depends = depends
+
+    @property
+    def arg_steps(self):
+        """Steps to execute without asking the user, None to ask for each step (optional)."""
+        return self.__arg_steps
+
+    @arg_steps.setter
+    def arg_steps(self, steps):
+        self.__arg_steps = steps
+
+    @property
+    def arg_fetch(self):
+        """Download mode of the sources, see constants.Fetch (optional)."""
+        return self.__arg_fetch
+
+    @arg_fetch.setter
+    def arg_fetch(self, fetch):
+        self.__arg_fetch = fetch
+
+    @property
+    def arg_archive(self):
+        """URL of the release archive for fetch=archive, overrides ARCHIVE_URL (optional)."""
+        return self.__arg_archive
+
+    @arg_archive.setter
+    def arg_archive(self, url):
+        self.__arg_archive = url
+
+    @property
+    def arg_sha256(self):
+        """SHA-256 of the release archive (optional)."""
+        return self.__arg_sha256
+
+    @arg_sha256.setter
+    def arg_sha256(self, sha256):
+        self.__arg_sha256 = sha256
+
+    @property
+    def arg_compiler_cache(self):
+        """Compiler cache for the compile steps, None for the default of the job (optional)."""
+        return self.__arg_compiler_cache
+
+    @arg_compiler_cache.setter
+    def arg_compiler_cache(self, tool):
+        self.__arg_compiler_cache = tool
+
+    @property
+    def arg_timeout(self):
+        """Timeout of each step in seconds, None for the default of the job (optional)."""
+        return self.__arg_timeout
+
+    @arg_timeout.setter
+    def arg_timeout(self, timeout):
+        self.__arg_timeout = timeout
+
+    @property
+    def arg_keep(self):
+        """Parts of the outputs, which are kept after the installation, see constants.Keep. None keeps all."""
+        return self.__arg_keep
+
+    @arg_keep.setter
+    def arg_keep(self, keep):
+        self.__arg_keep = keep
+
     @property
     def log(self):
         """Logger for this installers."""
         return self.__log
 
+    def _ask_for_step(self, step, action, default=True):
+        """Checks if a step should be executed, either by the steps parameter or by asking the user."""
+        if self.arg_steps is not None:
+            return step in self.arg_steps
+        return UtilsUI.ask_for_execute(action, default)
+
+    def _step_inputs(self, step):
+        """Returns the inputs of a step. A finished step is executed again, if its inputs have changed."""
+        if step == Step.DOWNLOAD:
+            if self.arg_fetch == Fetch.ARCHIVE:
+                return [self.arg_fetch, self.archive_url, self.arg_sha256]
+            return [self.arg_fetch, self.commit() if self.arg_fetch in (Fetch.SHALLOW, Fetch.WORKTREE) else None]
+        return [self.commit()]
+
+    def commit(self):
+        """
+        Returns the commit ID of the requested revision in the local repository, otherwise the revision itself.
+        Used as input of the steps, so a tag and its commit ID from a lockfile are the same checkout.
+        """
+        revision = self.revision
+        folder = getattr(self, 'REPO_FOLDER', None)
+        if revision is None or folder is None or MirrorCache.COMMIT_ID.match(revision) or \
+                self.arg_fetch == Fetch.ARCHIVE:
+            return revision
+        repo_dir = os.path.join(self.arg_dest, folder)
+        if not os.path.isdir(repo_dir):
+            return revision
+        commit = Hg.commit_of(repo_dir, revision) if self.VCS == Vcs.HG else Git.commit_of(repo_dir, revision)
+        return commit or revision
+
+    @property
+    def archive_url(self):
+        """URL of the release archive: the archive parameter or ARCHIVE_URL with the version, None if unknown."""
+        if self.arg_archive:
+            return self.arg_archive
+        if self.ARCHIVE_URL:
+            return self.ARCHIVE_URL.format(version=self.arg_version)
+        return None
+
+    def _step(self, step, action, function, default=True):
+        """
+        Executes function(context) as installation step, if it is selected and not already done with the same inputs.
+        All following steps are executed again, once a step was executed. Returns False if the step failed.
+        """
+        fingerprint = Utils.digest(self.name, step, *self._step_inputs(step))
+        done = not self.__stale and self.__manifest.is_done(self.name, step, fingerprint)
+        if self.__plan is not None:
+            return self.__plan_step(step, action, done, default)
+        if done:
+            UtilsUI.print(action + " ... already done.")
+            return True
+        if not self._ask_for_step(step, action, default):
+            self.__skipped.append(step)
+            return True
+
+        self.__stale = True
+        Progress.step(action)
+        span = Trace.begin(action, Trace.CATEGORY_STEP, self.name)
+        start = time.time()
+        replace = step == Step.DOWNLOAD and self.__manifest.recorded(self.name, step)
+        if replace:
+            # Replaces the outdated download, e.g. of another version or fetch mode.
+            outputs = [os.path.join(self.arg_dest, p) for p in self.outputs()]
+            success = Staging.replace(outputs, lambda: self.__execute_step(action, function))
+        else:
+            success = self.__execute_step(action, function)
+        Trace.end(span, success)
+        if success:
+            # The inputs are known after the step, e.g. the commit ID of a downloaded tag.
+            fingerprint = Utils.digest(self.name, step, *self._step_inputs(step))
+            self.__manifest.set_done(self.name, self.arg_version, step, fingerprint)
+            StepHistory.record(self.__history_key(step), time.time() - start)
+        elif not replace:
+            # A replaced download is restored, i.e. its record is still valid.
+            self.__manifest.reset(self.name, step)
+        return success
+
+    def __plan_step(self, step, action, done, default):
+        selected = default if self.arg_steps is None else step in self.arg_steps
+        if done:
+            state = PlanState.DONE
+        elif selected:
+            state = PlanState.RUN
+            self.__stale = True
+        else:
+            state = PlanState.SKIP
+        self.__plan.append((step, action, state, StepHistory.estimate(self.__history_key(step))))
+        return True
+
+    def __history_key(self, step):
+        return StepHistory.key(self.name, step, self.arg_fetch if step == Step.DOWNLOAD else None)
+
+    def __execute_step(self, action, function):
+        """Executes the step function with the timeout of the installer. A failed command fails the step."""
+        cmd_log = self.__context.output
+        timeout = self.arg_timeout or Command.timeout
+        if cmd_log:
+            cmd_log.deadline = time.time() + timeout if timeout else None
+        try:
+            return function(self.__context)
+        except CommandError as err:
+            UtilsUI.print_error(action + ' failed: ' + err.msg)
+            if cmd_log:
+                cmd_log.write(action + ' failed: ' + err.msg + '\n')
+            for line in err.tail:
+                UtilsUI.print_error('  ' + line)
+            if cmd_log:
+                UtilsUI.print_error('Complete output: ' + cmd_log.fname)
+            return False
+        finally:
+            if cmd_log:
+                cmd_log.deadline = None
+
+    def _restore_artifact(self, key, base_dir, steps):
+        """
+        Restores the build outputs from the artifact cache instead of executing the steps, e.g. configure and compile.
+        key is a function returning the artifact key. Returns True on a cache hit.
+        """
+        if self.arg_steps is not None and Step.COMPILE not in self.arg_steps:
+            return False
+        fingerprints = dict((s, Utils.digest(self.name, s, *self._step_inputs(s))) for s in steps)
+        if not self.__stale and all(self.__manifest.is_done(self.name, s, fingerprints[s]) for s in steps):
+            return False
+        action = 'Restore artifact ' + self.name
+        if self.__plan is not None:
+            if not ArtifactCache.contains(key()):
+                return False
+            self.__plan.append((PlanState.RESTORE, action, PlanState.RUN,
+                                StepHistory.estimate(self.__history_key(PlanState.RESTORE))))
+            return True
+
+        span = Trace.begin(action, Trace.CATEGORY_STEP, self.name)
+        start = time.time()
+        restored = ArtifactCache.restore(key(), base_dir)
+        Trace.end(span, restored)
+        if not restored:
+            return False
+        StepHistory.record(self.__history_key(PlanState.RESTORE), time.time() - start)
+        for s in steps:
+            self.__manifest.set_done(self.name, self.arg_version, s, fingerprints[s])
+        return True
+
     def _pre_install(self):
         """Is called before the installation. It can be used to check for tools which are required."""
         return True
 
     def _install(self):
-        """Abstract method, implements the installation."""
+        """Implements the installation, by default the I/O-bound steps followed by the CPU-bound steps."""
+        return self._fetch() and self._build()
+
+    def _fetch(self):
+        """Abstract method, implements the I/O-bound steps, e.g. download and initialize."""
         self.log.debug('No yet implemented: ' + str(self.name))
         return False
 
+    def _build(self):
+        """Implements the CPU-bound steps, e.g. configure and compile. Nothing to do by default."""
+        return True
+
     def _post_install(self):
         """Is called after a successful installation. Can be used to test installation or for user instructions."""
         return True
 
+    def tools(self):
+        """Programs which are required by the installer. They are probed once before the job is executed."""
+        return []
+
+    def outputs(self):
+        """Files and folders in the destination folder, which are created by the installer."""
+        folder = getattr(self, 'REPO_FOLDER', None)
+        return [folder] if folder else []
+
+    def parts(self):
+        """
+        Files and folders of the outputs per part of the keep parameter, e.g. {Keep.HEADERS: ['mydep/include']}.
+        Paths are relative to the destination folder and may contain wildcards, e.g. 'mydep/*.h'.
+        """
+        folder = getattr(self, 'REPO_FOLDER', None)
+        if not folder:
+            return {}
+        return {Keep.VCS: [os.path.join(folder, '.hg' if self.VCS == Vcs.HG else '.git')]}
+
+    @property
+    def pipelined(self):
+        """True if the installation is split into fetch() and build(), i.e. _install() is not overridden."""
+        return type(self)._install is Installer._install
+
     def install(self):
         """Starts the installation process."""
-        UtilsUI.print_install_begin(self.label)
+        return self.__run(self.label, self.__install, True)
+
+    def fetch(self):
+        """Starts the I/O-bound part of the installation, which is continued by build()."""
+        if not self.pipelined:
+            return True
+        return self.__run(self.label + ' (fetch)', lambda: self._pre_install() and self._fetch(), True)
+
+    def build(self):
+        """Finishes the installation after fetch(). Executes the whole installation, if it is not pipelined."""
+        if not self.pipelined:
+            return self.install()
+        return self.__run(self.label + ' (build)',
+                          lambda: self._build() and self._post_install() and self.__reduce(), False)
 
+    def plan(self):
+        """
+        Returns the steps of the installation without executing them, e.g. for a dry run.
+        A step is a tuple: step, action, state (see constants.PlanState), estimated seconds or None.
+        Questions are not asked, the default answer is assumed.
+        """
+        self.__manifest = StateManifest(self.arg_dest)
+        self.__stale = False
+        self.__plan = []
         try:
-            success = self._pre_install()
-            if success:
-                success = self._install()
+            self._install()
+            return self.__plan
+        finally:
+            self.__plan = None
+
+    def __install(self):
+        success = self._pre_install()
+        if success:
+            success = self._install()
+
+        if success:
+            success = self._post_install()
+        if success:
+            success = self.__reduce()
+        return success
 
-            if success:
-                success = self._post_install()
+    def __reduce(self):
+        """Prunes the outputs to the parts of the keep parameter, if all steps are done."""
+        # The system-wide installation is optional, the other steps still need the pruned files.
+        skipped = [s for s in self.__skipped if s != Step.INSTALL]
+        if self.arg_keep is not None and skipped:
+            UtilsUI.print('Not pruned to keep=' + ','.join(self.arg_keep) + ', steps are not done: ' +
+                          ', '.join(skipped))
+            return Footprint.reduce(self, prune=False)
+        return Footprint.reduce(self)
+
+    def __run(self, title, function, start):
+        task = Progress.begin(self.name)
+        UtilsUI.print_install_begin(title)
+        span = Trace.begin(title, Trace.CATEGORY_INSTALL, self.name)
+        if start:
+            self.__manifest = StateManifest(self.arg_dest)
+            self.__stale = False
+            self.__skipped = []
+
+        try:
+            # Other processes, which install to the same destination, wait until this one is finished.
+            with InstallLock(self.name, self.arg_dest), CommandLog(self.name, self.arg_dest, append=not start) as log:
+                self.__context = Context(self.arg_dest, output=log)
+                success = function()
         except Exception as ex:
             success = False
             self.log.error("Unexpected error:\n" + str(ex))
+        finally:
+            self.__context = None
 
-        UtilsUI.print_install_end(self.label)
+        Trace.end(span, success)
+        UtilsUI.print_install_end(title)
+        Progress.end(task, success)
         return success
 
     @classmethod
@@ -96,18 +461,124 @@ class Installer(object):
         raise Exception('Prototype method not implemented for: ' + str(cls))
 
     def matches(self, installer):
-        """Checks if this command should be used for execution."""
-        return installer.lower().startswith(self.name)
+        """Checks if this command should be used for execution, i.e. the name of the job line is equal."""
+        return installer.split(':', 1)[0].strip().lower() == self.name
 
     @staticmethod
     def load_prototypes(path):
         """Returns prototypes of all known installers."""
-        prototypes = []
-        loader = PluginLoader()
-        loader.load_directory(path, BaseClassCondition(Installer))
-        for k in loader.plugins:
-            clazz = loader.plugins[k]
-            if callable(clazz):
-                prototypes.append(clazz().prototype())
-
-        return prototypes
\ No newline at end of file
+        index = InstallerIndex(path)
+        return [index.prototype(name) for name in index.names]
+
+
+class InstallerIndex(object):
+    """
+    Index of the installers in a folder: installer name -> module -> class.
+    The index is cached on disk and updated for modified files only. Modules are imported on first use.
+    """
+
+    log = logging.getLogger(__name__)
+
+    enabled = True
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'packbacker', 'installer-index.json')
+
+    def __init__(self, plugin_dir, package='packbacker.installers'):
+        self._plugin_dir = os.path.realpath(plugin_dir)
+        self._package = package
+        self._entries = {}  # name -> (file name, class name)
+        self._prototypes = {}
+        self.update()
+
+    @property
+    def names(self):
+        """Names of all installers in the folder."""
+        return sorted(self._entries)
+
+    def prototype(self, name):
+        """Returns the prototype of the installer, the module is imported if necessary. None for unknown names."""
+        if name not in self._prototypes:
+            if name not in self._entries:
+                return None
+            fname, class_name = self._entries[name]
+            module = self._import(fname)
+            self._prototypes[name] = getattr(module, class_name).prototype()
+        return self._prototypes[name]
+
+    def update(self):
+        """Reads the cached index and scans the files, which are new or modified since then."""
+        cache = self._read_cache()
+        cached_files = cache.get(self._plugin_dir, {})
+        files = {}
+        for fname in sorted(os.listdir(self._plugin_dir)):
+            full_path = os.path.join(self._plugin_dir, fname)
+            if not fname.endswith('.py') or fname.startswith('_') or not os.path.isfile(full_path):
+                continue
+            st = os.stat(full_path)
+            entry = cached_files.get(fname)
+            if entry is None or entry['mtime'] != st.st_mtime_ns or entry['size'] != st.st_size:
+                InstallerIndex.log.debug('Scanning installers in: ' + full_path)
+                entry = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'installers': self._scan(fname)}
+            files[fname] = entry
+
+        self._entries = {}
+        for fname, entry in files.items():
+            for name, class_name in entry['installers'].items():
+                self._entries[name] = (fname, class_name)
+
+        if files != cached_files:
+            cache[self._plugin_dir] = files
+            self._write_cache(cache)
+
+    def _scan(self, fname):
+        installers = {}
+        try:
+            module = self._import(fname)
+        except Exception:
+            InstallerIndex.log.exception('Error loading file %s. Ignored' % fname)
+            return installers
+
+        for attr, obj in vars(module).items():
+            if isinstance(obj, type) and issubclass(obj, Installer) and obj.__module__ == module.__name__:
+                try:
+                    prototype = obj.prototype()
+                except Exception:
+                    continue
+                installers[prototype.name] = attr
+                self._prototypes[prototype.name] = prototype
+        return installers
+
+    def _import(self, fname):
+        module_name = self._package + '.' + os.path.splitext(fname)[0]
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(self._plugin_dir, fname))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules[module_name]
+            raise
+        return module
+
+    def _read_cache(self):
+        if not InstallerIndex.enabled:
+            return {}
+        try:
+            with open(InstallerIndex.path, 'r') as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return {}
+
+    def _write_cache(self, cache):
+        if not InstallerIndex.enabled:
+            return
+        tmp_path = InstallerIndex.path + '.tmp-' + str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(InstallerIndex.path), exist_ok=True)
+            with open(tmp_path, 'w') as fd:
+                json.dump(cache, fd, indent=2, sort_keys=True)
+            os.replace(tmp_path, InstallerIndex.path)
+        except (IOError, OSError) as err:
+            InstallerIndex.log.warning('Could not write installer index ' + InstallerIndex.path + ': ' + str(err))
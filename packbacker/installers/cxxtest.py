@@ -1,13 +1,17 @@
 __author__ = 'Christof Pieloth'
 
 import os
-from subprocess import call
 
+from packbacker.archive import Archive
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
 from packbacker.constants import Parameter
+from packbacker.constants import Step
 from packbacker.errors import ParameterError
-from packbacker.utils import Utils
+from packbacker.toolchain import Toolchain
 from packbacker.utils import UtilsUI
 from packbacker.installer import Installer
+from packbacker.vcs import Git
 
 
 class CxxTest(Installer):
@@ -16,7 +20,10 @@ class CxxTest(Installer):
     WWW: http://cxxtest.com
     """
 
+    FETCH_MODES = Fetch.ALL
+    ARCHIVE_URL = "https://github.com/CxxTest/cxxtest/archive/refs/tags/{version}.tar.gz"
     REPO_FOLDER = "cxxtest"
+    REPO_URL = "https://github.com/CxxTest/cxxtest.git"
 
     def __init__(self):
         Installer.__init__(self, 'cxxtest', 'CxxTest')
@@ -37,19 +44,30 @@ class CxxTest(Installer):
     def prototype(cls):
         return CxxTest()
 
+    def tools(self):
+        return (["git"] if self.arg_fetch != Fetch.ARCHIVE else []) + ["python"]
+
+    def parts(self):
+        parts = Installer.parts(self)
+        parts[Keep.HEADERS] = [os.path.join(self.REPO_FOLDER, "cxxtest")]
+        # cxxtestgen generates the test runners.
+        parts[Keep.LIBS] = [os.path.join(self.REPO_FOLDER, "bin"), os.path.join(self.REPO_FOLDER, "python")]
+        return parts
+
     def _pre_install(self):
         success = True
-        success = success and Utils.check_program("git", "--version")
-        success = success and Utils.check_program("python", "--version")
+        if self.arg_fetch != Fetch.ARCHIVE:
+            success = success and Toolchain.check("git")
+        success = success and Toolchain.check("python")
         return success
 
-    def _install(self):
+    def _fetch(self):
         success = True
 
-        if success and UtilsUI.ask_for_execute("Download " + self.name):
-            success = success and self.__download()
-        if success and UtilsUI.ask_for_execute("Initialize " + self.name):
-            success = success and self.__initialize()
+        success = success and self._step(Step.DOWNLOAD, "Download " + self.name, self.__download)
+        if self.arg_fetch != Fetch.ARCHIVE:
+            # The archive contains the requested version only.
+            success = success and self._step(Step.INITIALIZE, "Initialize " + self.name, self.__initialize)
 
         return success
 
@@ -66,18 +84,24 @@ class CxxTest(Installer):
 
         return True
 
-    def __download(self):
+    def __download(self, ctx):
         UtilsUI.print_step_begin("Downloading")
-        repo = "https://github.com/CxxTest/cxxtest.git"
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        call("git clone " + repo + " " + repo_dir, shell=True)
+        repo = self.REPO_URL
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        if self.arg_fetch == Fetch.ARCHIVE:
+            Archive.fetch(self.archive_url, repo_dir, self.arg_sha256)
+        elif self.arg_fetch == Fetch.SHALLOW:
+            Git.fetch_revision(ctx, repo, repo_dir, self.revision)
+        elif self.arg_fetch == Fetch.WORKTREE:
+            Git.add_worktree(ctx, repo, repo_dir, self.revision)
+        else:
+            Git.clone(ctx, repo, repo_dir, self.revision)
         UtilsUI.print_step_end("Downloading")
         return True
 
-    def __initialize(self):
+    def __initialize(self, ctx):
         UtilsUI.print_step_begin("Initializing")
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        os.chdir(repo_dir)
-        call("git checkout " + self.arg_version, shell=True)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        ctx.check(["git", "checkout", self.revision], cwd=repo_dir)
         UtilsUI.print_step_end("Initializing")
         return True
\ No newline at end of file
@@ -1,13 +1,18 @@
 __author__ = 'Christof Pieloth'
 
 import os
-from subprocess import call
 
+from packbacker.archive import Archive
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
 from packbacker.constants import Parameter
+from packbacker.constants import Step
+from packbacker.constants import Vcs
 from packbacker.errors import ParameterError
-from packbacker.utils import Utils
+from packbacker.toolchain import Toolchain
 from packbacker.utils import UtilsUI
 from packbacker.installer import Installer
+from packbacker.vcs import Hg
 
 
 class Eigen3(Installer):
@@ -16,7 +21,11 @@ class Eigen3(Installer):
     WWW: http://eigen.tuxfamily.org
     """
 
+    FETCH_MODES = Fetch.ALL
+    ARCHIVE_URL = "https://gitlab.com/libeigen/eigen/-/archive/{version}/eigen-{version}.tar.gz"
     REPO_FOLDER = "eigen3"
+    REPO_URL = "https://bitbucket.org/eigen/eigen/"
+    VCS = Vcs.HG
 
     def __init__(self):
         Installer.__init__(self, 'eigen3', 'Eigen version 3')
@@ -37,18 +46,29 @@ class Eigen3(Installer):
     def prototype(cls):
         return Eigen3()
 
+    def tools(self):
+        return ["hg"] if self.arg_fetch != Fetch.ARCHIVE else []
+
+    def parts(self):
+        parts = Installer.parts(self)
+        # The signature file is used by FindEigen3.cmake to find the include folder.
+        parts[Keep.HEADERS] = [os.path.join(self.REPO_FOLDER, "Eigen"), os.path.join(self.REPO_FOLDER, "unsupported"),
+                               os.path.join(self.REPO_FOLDER, "signature_of_eigen3_matrix_library")]
+        return parts
+
     def _pre_install(self):
         success = True
-        success = success and Utils.check_program("hg", "--version")
+        if self.arg_fetch != Fetch.ARCHIVE:
+            success = success and Toolchain.check("hg")
         return success
 
-    def _install(self):
+    def _fetch(self):
         success = True
 
-        if success and UtilsUI.ask_for_execute("Download " + self.name):
-            success = success and self.__download()
-        if success and UtilsUI.ask_for_execute("Initialize " + self.name):
-            success = success and self.__initialize()
+        success = success and self._step(Step.DOWNLOAD, "Download " + self.name, self.__download)
+        if self.arg_fetch != Fetch.ARCHIVE:
+            # The archive contains the requested version only.
+            success = success and self._step(Step.INITIALIZE, "Initialize " + self.name, self.__initialize)
 
         return success
 
@@ -57,18 +77,24 @@ class Eigen3(Installer):
         UtilsUI.print_env_var('EIGEN3_INCLUDE_DIR', include_dir)
         return True
 
-    def __download(self):
+    def __download(self, ctx):
         UtilsUI.print_step_begin("Downloading")
-        repo = "https://bitbucket.org/eigen/eigen/"
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        call("hg clone " + repo + " " + repo_dir, shell=True)
+        repo = self.REPO_URL
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        if self.arg_fetch == Fetch.ARCHIVE:
+            Archive.fetch(self.archive_url, repo_dir, self.arg_sha256)
+        elif self.arg_fetch == Fetch.SHALLOW:
+            Hg.fetch_revision(ctx, repo, repo_dir, self.revision)
+        elif self.arg_fetch == Fetch.WORKTREE:
+            Hg.share(ctx, repo, repo_dir, self.revision)
+        else:
+            Hg.clone(ctx, repo, repo_dir, self.revision)
         UtilsUI.print_step_end("Downloading")
         return True
 
-    def __initialize(self):
+    def __initialize(self, ctx):
         UtilsUI.print_step_begin("Initializing")
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        os.chdir(repo_dir)
-        call("hg update " + self.arg_version, shell=True)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        ctx.check(["hg", "update", self.revision], cwd=repo_dir)
         UtilsUI.print_step_end("Initializing")
         return True
\ No newline at end of file
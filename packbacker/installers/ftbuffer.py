@@ -1,13 +1,20 @@
 __author__ = 'Christof Pieloth'
 
 import os
-from subprocess import call
+import shutil
 
+from packbacker.artifacts import ArtifactCache
+from packbacker.ccache import CompilerCache
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
 from packbacker.constants import Parameter
+from packbacker.constants import Step
 from packbacker.errors import ParameterError
-from packbacker.utils import Utils
+from packbacker.toolchain import Toolchain
 from packbacker.utils import UtilsUI
 from packbacker.installer import Installer
+from packbacker.parallelism import Make
+from packbacker.vcs import Git
 
 
 class FtBuffer(Installer):
@@ -16,10 +23,12 @@ class FtBuffer(Installer):
     WWW: fieldtrip.fcdonders.nl/development/realtime
     """
     REPO_FOLDER = "fieldtrip"
+    REPO_URL = "https://github.com/fieldtrip/fieldtrip.git"
     FTB_BUFFER_INCLUDE = "realtime/src/buffer/src"
     FTB_BUFFER_LIBRARY = "libFtbBuffer.a"
     FTB_CLIENT_INCLUDE = "realtime/src/buffer/cpp"
     FTB_CLIENT_LIBRARY = "libFtbClient.a"
+    FTB_CLIENT_FLAGS = "-I../src -I. -Wunused -Wall -pedantic -O3 -fPIC"
 
     def __init__(self):
         Installer.__init__(self, 'ftbuffer', 'FieldTrip Buffer')
@@ -40,26 +49,51 @@ class FtBuffer(Installer):
     def prototype(cls):
         return FtBuffer()
 
+    def tools(self):
+        return ["git", "make", "gcc", "g++", "ar"]
+
+    def parts(self):
+        parts = Installer.parts(self)
+        parts[Keep.HEADERS] = [os.path.join(self.REPO_FOLDER, self.FTB_BUFFER_INCLUDE, "*.h"),
+                               os.path.join(self.REPO_FOLDER, self.FTB_CLIENT_INCLUDE, "*.h")]
+        parts[Keep.LIBS] = [os.path.join(self.REPO_FOLDER, self.FTB_BUFFER_INCLUDE, self.FTB_BUFFER_LIBRARY),
+                            os.path.join(self.REPO_FOLDER, self.FTB_CLIENT_INCLUDE, self.FTB_CLIENT_LIBRARY)]
+        parts[Keep.BUILD] = [os.path.join(self.REPO_FOLDER, self.FTB_BUFFER_INCLUDE, "*.o"),
+                             os.path.join(self.REPO_FOLDER, self.FTB_CLIENT_INCLUDE, "*.o")]
+        return parts
+
     def _pre_install(self):
         success = True
-        success = success and Utils.check_program("git", "--version")
-        success = success and Utils.check_program("make", "--version")
-        success = success and Utils.check_program("gcc", "--version")
-        success = success and Utils.check_program("g++", "--version")
+        success = success and Toolchain.check("git")
+        success = success and Toolchain.check("make")
+        success = success and Toolchain.check("gcc")
+        success = success and Toolchain.check("g++")
         return success
 
-    def _install(self):
+    def _fetch(self):
         success = True
 
-        if success and UtilsUI.ask_for_execute("Download " + self.name):
-            success = success and self.__download()
-        if success and UtilsUI.ask_for_execute("Initialize " + self.name):
-            success = success and self.__initialize()
-        if success and UtilsUI.ask_for_execute("Compile " + self.name):
-            success = success and self.__compile()
+        success = success and self._step(Step.DOWNLOAD, "Download " + self.name, self.__download)
+        success = success and self._step(Step.INITIALIZE, "Initialize " + self.name, self.__initialize)
+
+        return success
+
+    def _build(self):
+        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
+        if self._restore_artifact(self.__artifact_key, repo_dir, [Step.COMPILE]):
+            return True
+
+        success = self._step(Step.COMPILE, "Compile " + self.name, self.__compile)
 
         return success
 
+    def _step_inputs(self, step):
+        inputs = Installer._step_inputs(self, step)
+        if step in (Step.COMPILE,):
+            inputs.append(self.FTB_CLIENT_FLAGS)
+            inputs.append(CompilerCache.tool_for(self))
+        return inputs
+
     def _post_install(self):
         ftb_buffer_include_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, self.FTB_BUFFER_INCLUDE)
         UtilsUI.print_env_var("FTB_BUFFER_INCLUDE_DIR=", ftb_buffer_include_dir)
@@ -76,39 +110,55 @@ class FtBuffer(Installer):
         UtilsUI.print_env_var("FTB_CLIENT_LIBRARY=", ftb_client_lib)
         return True
 
-    def __download(self):
+    def __download(self, ctx):
         UtilsUI.print_step_begin("Downloading")
-        repo = "https://github.com/fieldtrip/fieldtrip.git"
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        call("git clone " + repo + " " + repo_dir, shell=True)
+        repo = self.REPO_URL
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        if self.arg_fetch == Fetch.SHALLOW:
+            Git.fetch_revision(ctx, repo, repo_dir, self.revision)
+        elif self.arg_fetch == Fetch.WORKTREE:
+            Git.add_worktree(ctx, repo, repo_dir, self.revision)
+        else:
+            Git.clone(ctx, repo, repo_dir, self.revision)
         UtilsUI.print_step_end("Downloading")
         return True
 
-    def __initialize(self):
+    def __initialize(self, ctx):
         UtilsUI.print_step_begin("Initializing")
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        os.chdir(repo_dir)
-        call("git checkout " + self.arg_version, shell=True)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        ctx.check(["git", "checkout", self.revision], cwd=repo_dir)
         UtilsUI.print_step_end("Initializing")
         return True
 
-    def __compile(self):
+    def __compile(self, ctx):
         UtilsUI.print_step_begin("Compiling")
-        self.__compile_ftb_buffer()
-        self.__compile_ftb_client()
+        cache = CompilerCache.for_installer(self)
+        stats = cache.statistics()
+        try:
+            build_ctx = ctx.derive(cache.environment())
+            self.__compile_ftb_buffer(build_ctx, cache)
+            self.__compile_ftb_client(build_ctx, cache)
+        finally:
+            cache.print_statistics(stats)
+        libs = [os.path.join(self.FTB_BUFFER_INCLUDE, self.FTB_BUFFER_LIBRARY),
+                os.path.join(self.FTB_CLIENT_INCLUDE, self.FTB_CLIENT_LIBRARY)]
+        ArtifactCache.store(self.__artifact_key(), ctx.path(self.REPO_FOLDER), libs)
         UtilsUI.print_step_end("Compiling")
         return True
 
-    def __compile_ftb_buffer(self):
-        buffer_path = os.path.join(self.arg_dest, self.REPO_FOLDER, self.FTB_BUFFER_INCLUDE)
-        os.chdir(buffer_path)
-        call("make -j2", shell=True)
-        call("cp libbuffer.a " + self.FTB_BUFFER_LIBRARY, shell=True)
-        return True
+    def __compile_ftb_buffer(self, ctx, cache):
+        buffer_path = ctx.path(self.REPO_FOLDER, self.FTB_BUFFER_INCLUDE)
+        args = ["CC=" + cache.launch("gcc")] if cache.enabled else []
+        Make.call(ctx, buffer_path, "Compiling FieldTrip Buffer", args)
+        shutil.copy(os.path.join(buffer_path, "libbuffer.a"), os.path.join(buffer_path, self.FTB_BUFFER_LIBRARY))
 
-    def __compile_ftb_client(self):
-        client_path = os.path.join(self.arg_dest, self.REPO_FOLDER, self.FTB_CLIENT_INCLUDE)
-        os.chdir(client_path)
-        call("g++ -c FtConnection.cc -I../src -I. -Wunused -Wall -pedantic -O3 -fPIC", shell=True)
-        call("ar rv " + self.FTB_CLIENT_LIBRARY + " FtConnection.o", shell=True)
-        return True
+    def __compile_ftb_client(self, ctx, cache):
+        client_path = ctx.path(self.REPO_FOLDER, self.FTB_CLIENT_INCLUDE)
+        compile_cmd = cache.launch("g++").split() + ["-c", "FtConnection.cc"] + self.FTB_CLIENT_FLAGS.split()
+        ctx.check(compile_cmd, cwd=client_path)
+        ctx.check(["ar", "rv", self.FTB_CLIENT_LIBRARY, "FtConnection.o"], cwd=client_path)
+
+    def __artifact_key(self):
+        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
+        return ArtifactCache.key(self.name, self.arg_version, Git.head_revision(repo_dir), self.FTB_CLIENT_FLAGS,
+                                 Toolchain.version("gcc"), Toolchain.version("g++"))
@@ -1,13 +1,19 @@
 __author__ = 'Christof Pieloth'
 
 import os
-from subprocess import call
 
+from packbacker.artifacts import ArtifactCache
+from packbacker.ccache import CompilerCache
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
 from packbacker.constants import Parameter
+from packbacker.constants import Step
 from packbacker.errors import ParameterError
-from packbacker.utils import Utils
+from packbacker.toolchain import Toolchain
 from packbacker.utils import UtilsUI
 from packbacker.installer import Installer
+from packbacker.parallelism import Make
+from packbacker.vcs import Git
 
 
 class MneCpp(Installer):
@@ -16,6 +22,7 @@ class MneCpp(Installer):
     WWW: https://github.com/mne-tools/mne-cpp"""
 
     REPO_FOLDER = "mne-cpp"
+    REPO_URL = "https://github.com/mne-tools/mne-cpp.git"
     PARAM_QMAKE5 = "qmake5"
 
     def __init__(self):
@@ -49,29 +56,52 @@ class MneCpp(Installer):
     def prototype(cls):
         return MneCpp()
 
+    def tools(self):
+        return ["git", "make", self.arg_qmake5, "g++", "c++", os.environ.get('CXX', 'c++')]
+
+    def parts(self):
+        parts = Installer.parts(self)
+        parts[Keep.HEADERS] = [os.path.join(self.REPO_FOLDER, "MNE", "*.h")]
+        parts[Keep.LIBS] = [os.path.join(self.REPO_FOLDER, "lib")]
+        # qmake builds in the source folder.
+        parts[Keep.BUILD] = [os.path.join(self.REPO_FOLDER, "MNE")]
+        return parts
+
     def _pre_install(self):
         success = True
-        success = success and Utils.check_program("git", "--version")
-        success = success and Utils.check_program("make", "--version")
-        success = success and Utils.check_program(self.arg_qmake5, "--version")
-        if not Utils.check_program("g++", "--version") and not Utils.check_program("c++", "--version"):
+        success = success and Toolchain.check("git")
+        success = success and Toolchain.check("make")
+        success = success and Toolchain.check(self.arg_qmake5)
+        if not Toolchain.check("g++") and not Toolchain.check("c++"):
             success = False
         return success
 
-    def _install(self):
+    def _fetch(self):
         success = True
 
-        if success and UtilsUI.ask_for_execute("Download " + self.name):
-            success = success and self.__download()
-        if success and UtilsUI.ask_for_execute("Initialize " + self.name):
-            success = success and self.__initialize()
-        if success and UtilsUI.ask_for_execute("Configure " + self.name):
-            success = success and self.__configure()
-        if success and UtilsUI.ask_for_execute("Compile " + self.name):
-            success = success and self.__compile()
+        success = success and self._step(Step.DOWNLOAD, "Download " + self.name, self.__download)
+        success = success and self._step(Step.INITIALIZE, "Initialize " + self.name, self.__initialize)
+
+        return success
+
+    def _build(self):
+        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
+        if self._restore_artifact(self.__artifact_key, repo_dir, [Step.CONFIGURE, Step.COMPILE]):
+            return True
+
+        success = True
+        success = success and self._step(Step.CONFIGURE, "Configure " + self.name, self.__configure)
+        success = success and self._step(Step.COMPILE, "Compile " + self.name, self.__compile)
 
         return success
 
+    def _step_inputs(self, step):
+        inputs = Installer._step_inputs(self, step)
+        if step in (Step.CONFIGURE, Step.COMPILE):
+            inputs.append(self.arg_qmake5)
+            inputs.append(CompilerCache.tool_for(self))
+        return inputs
+
     def _post_install(self):
         include_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, "MNE")
         UtilsUI.print_env_var("MNE_INCLUDE_DIR", include_dir)
@@ -80,36 +110,53 @@ class MneCpp(Installer):
         UtilsUI.print_env_var("MNE_LIBRARY_DIR", library_path)
         return True
 
-    def __download(self):
+    def __download(self, ctx):
         UtilsUI.print_step_begin("Downloading")
-        repo = "https://github.com/mne-tools/mne-cpp.git"
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        call("git clone " + repo + " " + repo_dir, shell=True)
+        repo = self.REPO_URL
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        if self.arg_fetch == Fetch.SHALLOW:
+            Git.fetch_revision(ctx, repo, repo_dir, self.revision)
+        elif self.arg_fetch == Fetch.WORKTREE:
+            Git.add_worktree(ctx, repo, repo_dir, self.revision)
+        else:
+            Git.clone(ctx, repo, repo_dir, self.revision)
         UtilsUI.print_step_end("Downloading")
         return True
 
-    def __initialize(self):
+    def __initialize(self, ctx):
         UtilsUI.print_step_begin("Initializing")
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        os.chdir(repo_dir)
-        call("git checkout " + self.arg_version, shell=True)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        ctx.check(["git", "checkout", self.revision], cwd=repo_dir)
         UtilsUI.print_step_end("Initializing")
         return True
 
-    def __configure(self):
+    def __configure(self, ctx):
         UtilsUI.print_step_begin("Configuring")
-        mne_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, "MNE")
-        os.chdir(mne_dir)
-        mne_configure = self.arg_qmake5 + " -recursive"
-        call(mne_configure, shell=True)
+        mne_dir = ctx.path(self.REPO_FOLDER, "MNE")
+        mne_configure = [self.arg_qmake5, "-recursive"]
+        cache = CompilerCache.for_installer(self)
+        if cache.enabled:
+            mne_configure.append("QMAKE_CC=" + cache.launch(os.environ.get('CC', 'gcc')))
+            mne_configure.append("QMAKE_CXX=" + cache.launch(os.environ.get('CXX', 'g++')))
+        ctx.derive(cache.environment()).check(mne_configure, cwd=mne_dir)
         UtilsUI.print_step_end("Configuring")
         return True
 
-    def __compile(self):
+    def __compile(self, ctx):
         UtilsUI.print_step_begin("Compiling")
-        mne_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, "MNE")
-        os.chdir(mne_dir)
-        jobs = UtilsUI.ask_for_make_jobs()
-        call("make -j" + str(jobs), shell=True)
+        mne_dir = ctx.path(self.REPO_FOLDER, "MNE")
+        cache = CompilerCache.for_installer(self)
+        stats = cache.statistics()
+        try:
+            Make.call(ctx.derive(cache.environment()), mne_dir, "Compiling MNE-CPP")
+        finally:
+            cache.print_statistics(stats)
+        ArtifactCache.store(self.__artifact_key(), ctx.path(self.REPO_FOLDER), ["lib"])
         UtilsUI.print_step_end("Compiling")
         return True
+
+    def __artifact_key(self):
+        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
+        compiler = os.environ.get('CXX', 'c++')
+        return ArtifactCache.key(self.name, self.arg_version, Git.head_revision(repo_dir), "-recursive",
+                                 Toolchain.version(self.arg_qmake5), Toolchain.version(compiler))
@@ -1,13 +1,19 @@
 __author__ = 'Christof Pieloth'
 
 import os
-from subprocess import call
 
+from packbacker.artifacts import ArtifactCache
+from packbacker.ccache import CompilerCache
+from packbacker.cmake import CMake
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
 from packbacker.constants import Parameter
+from packbacker.constants import Step
 from packbacker.errors import ParameterError
-from packbacker.utils import Utils
+from packbacker.toolchain import Toolchain
 from packbacker.utils import UtilsUI
 from packbacker.installer import Installer
+from packbacker.vcs import Git
 
 
 class Pcl(Installer):
@@ -17,11 +23,34 @@ class Pcl(Installer):
     """
 
     REPO_FOLDER = "pcl"
+    REPO_URL = "https://github.com/PointCloudLibrary/pcl.git"
     BUILD_FOLDER = "build"
+    PARAM_GENERATOR = "generator"
+    PARAM_CMAKE_OPTIONS = "cmake_options"
 
     def __init__(self):
         Installer.__init__(self, "pcl", "Point Cloud Library (PCL)")
         self.arg_version = "pcl-1.7.1"  # 2013-10-07
+        self.__arg_generator = CMake.MAKE
+        self.__arg_cmake_options = []
+
+    @property
+    def arg_generator(self):
+        """Build system, which is generated by CMake: make or ninja."""
+        return self.__arg_generator
+
+    @arg_generator.setter
+    def arg_generator(self, generator):
+        self.__arg_generator = generator
+
+    @property
+    def arg_cmake_options(self):
+        """Additional CMake options, a -DNAME=VALUE replaces the default of NAME."""
+        return self.__arg_cmake_options
+
+    @arg_cmake_options.setter
+    def arg_cmake_options(self, options):
+        self.__arg_cmake_options = options
 
     @classmethod
     def instance(cls, params):
@@ -32,66 +61,105 @@ class Pcl(Installer):
             raise ParameterError(Parameter.DEST_DIR + ' parameter is missing!')
         if Parameter.VERSION in params:
             installer.arg_version = params[Parameter.VERSION]
+        if installer.PARAM_GENERATOR in params:
+            CMake.check_generator(params[installer.PARAM_GENERATOR].strip())
+            installer.arg_generator = params[installer.PARAM_GENERATOR].strip()
+        if installer.PARAM_CMAKE_OPTIONS in params:
+            installer.arg_cmake_options = CMake.parse_options(params[installer.PARAM_CMAKE_OPTIONS])
         return installer
 
     @classmethod
     def prototype(cls):
         return Pcl()
 
+    def tools(self):
+        return ["git", "cmake", self.arg_generator, "g++", "c++", os.environ.get('CXX', 'c++')]
+
+    def parts(self):
+        parts = Installer.parts(self)
+        # Headers of the modules and the generated ones in the build folder, e.g. pcl_config.h.
+        parts[Keep.HEADERS] = [os.path.join(self.REPO_FOLDER, "*.h"), os.path.join(self.REPO_FOLDER, "*.hpp")]
+        # PCL_DIR is the build folder with PCLConfig.cmake.
+        parts[Keep.LIBS] = [os.path.join(self.REPO_FOLDER, self.BUILD_FOLDER, "lib"),
+                            os.path.join(self.REPO_FOLDER, self.BUILD_FOLDER, "*.cmake")]
+        parts[Keep.BUILD] = [os.path.join(self.REPO_FOLDER, self.BUILD_FOLDER)]
+        return parts
+
     def _pre_install(self):
         UtilsUI.print("NOTE: Before installing PCL from source, please try to install prebuilt binaries:")
         UtilsUI.print("      http://www.pointclouds.org/downloads/")
         success = True
-        success = success and Utils.check_program("git", "--version")
-        success = success and Utils.check_program("cmake", "--version")
-        success = success and Utils.check_program("make", "--version")
-        if not Utils.check_program("g++", "--version") and not Utils.check_program("c++", "--version"):
+        success = success and Toolchain.check("git")
+        success = success and Toolchain.check("cmake")
+        success = success and Toolchain.check(self.arg_generator)
+        if not Toolchain.check("g++") and not Toolchain.check("c++"):
             success = False
         return success
 
-    def _install(self):
+    def _fetch(self):
         success = True
 
-        if success and UtilsUI.ask_for_execute("Download " + self.name):
-            success = success and self.__download()
-        if success and UtilsUI.ask_for_execute("Initialize " + self.name):
-            success = success and self.__initialize()
-        if success and UtilsUI.ask_for_execute("Configure " + self.name):
-            success = success and self.__configure()
-        if success and UtilsUI.ask_for_execute("Compile " + self.name):
-            success = success and self.__compile_install()
+        success = success and self._step(Step.DOWNLOAD, "Download " + self.name, self.__download)
+        success = success and self._step(Step.INITIALIZE, "Initialize " + self.name, self.__initialize)
+
+        return success
+
+    def _build(self):
+        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
+        if self._restore_artifact(self.__artifact_key, repo_dir, [Step.CONFIGURE, Step.COMPILE]):
+            return True
+
+        success = True
+        success = success and self._step(Step.CONFIGURE, "Configure " + self.name, self.__configure)
+        success = success and self._step(Step.COMPILE, "Compile " + self.name, self.__compile_install)
 
         return success
 
+    def _step_inputs(self, step):
+        inputs = Installer._step_inputs(self, step)
+        if step in (Step.CONFIGURE, Step.COMPILE):
+            inputs.append(self.__cmake_options())
+            inputs.append(self.arg_generator)
+            inputs.append(CompilerCache.tool_for(self))
+        return inputs
+
     def _post_install(self):
         pcl_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, self.BUILD_FOLDER)
         UtilsUI.print_env_var("PCL_DIR=", pcl_dir)
         return True
 
-    def __download(self):
+    def __download(self, ctx):
         UtilsUI.print_step_begin("Downloading")
-        repo = "https://github.com/PointCloudLibrary/pcl.git"
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        call("git clone " + repo + " " + repo_dir, shell=True)
+        repo = self.REPO_URL
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        if self.arg_fetch == Fetch.SHALLOW:
+            Git.fetch_revision(ctx, repo, repo_dir, self.revision)
+        elif self.arg_fetch == Fetch.WORKTREE:
+            Git.add_worktree(ctx, repo, repo_dir, self.revision)
+        else:
+            Git.clone(ctx, repo, repo_dir, self.revision)
         UtilsUI.print_step_end("Downloading")
         return True
 
-    def __initialize(self):
+    def __initialize(self, ctx):
         UtilsUI.print_step_begin("Initializing")
-        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
-        os.chdir(repo_dir)
-        call("git checkout " + self.arg_version, shell=True)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        ctx.check(["git", "checkout", self.revision], cwd=repo_dir)
         UtilsUI.print_step_end("Initializing")
         return True
 
-    def __configure(self):
+    def __configure(self, ctx):
         UtilsUI.print_step_begin("Configuring")
-        build_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, self.BUILD_FOLDER)
-        if not os.path.exists(build_dir):
-            os.mkdir(build_dir)
-        else:
-            print("You may have to clear the folder:\n" + build_dir)
-        os.chdir(build_dir)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        build_dir = os.path.join(repo_dir, self.BUILD_FOLDER)
+        cache = CompilerCache.for_installer(self)
+        options = self.__cmake_options() + cache.cmake_options()
+        key = CMake.key(self.name, self.arg_generator, options)
+        CMake.configure(ctx.derive(cache.environment()), repo_dir, build_dir, self.arg_generator, options, key)
+        UtilsUI.print_step_end("Configuring")
+        return True
+
+    def __cmake_options(self):
         # Check and test, which options can be disabled to get required libs
         # Print dependencies with two following cmake: cmake -D...; cmake -D...
         options = []
@@ -106,18 +174,29 @@ class Pcl(Installer):
         options.append("-DBUILD_surface_on_nurbs=OFF")
         options.append("-DBUILD_tracking=OFF")
         options.append("-DBUILD_visualization=OFF")
-        cmake_cmd = "cmake " + ' '.join(options) + " ../"
-        call(cmake_cmd, shell=True)
-        UtilsUI.print_step_end("Configuring")
-        return True
+        return CMake.merge_options(options, self.arg_cmake_options)
+
+    def __artifact_key(self):
+        # The build folder contains absolute paths, so the destination is part of the key.
+        repo_dir = os.path.join(self.arg_dest, self.REPO_FOLDER)
+        compiler = os.environ.get('CXX', 'c++')
+        return ArtifactCache.key(self.name, self.arg_version, Git.head_revision(repo_dir), self.__cmake_options(),
+                                 self.arg_generator, self.arg_dest, Toolchain.version(compiler),
+                                 Toolchain.version('cmake'))
 
-    def __compile_install(self):
+    def __compile_install(self, ctx):
         UtilsUI.print_step_begin("Compiling & Installing")
-        build_dir = os.path.join(self.arg_dest, self.REPO_FOLDER, self.BUILD_FOLDER)
-        os.chdir(build_dir)
-        jobs = UtilsUI.ask_for_make_jobs()
-        call("make -j" + str(jobs), shell=True)
-        if UtilsUI.ask_for_execute("Install PCL to system? (requires root/sudo)"):
-            call("sudo make install", shell=True)
+        build_dir = ctx.path(self.REPO_FOLDER, self.BUILD_FOLDER)
+        cache = CompilerCache.for_installer(self)
+        stats = cache.statistics()
+        try:
+            CMake.build(ctx.derive(cache.environment()), build_dir, self.arg_generator, "Compiling PCL")
+        finally:
+            cache.print_statistics(stats)
+        repo_dir = ctx.path(self.REPO_FOLDER)
+        ArtifactCache.store(self.__artifact_key(), repo_dir, [self.BUILD_FOLDER])
+        if self._ask_for_step(Step.INSTALL, "Install PCL to system? (requires root/sudo)", False):
+            install_cmd = ["sudo"] + CMake.install_command(self.arg_generator)
+            ctx.check(install_cmd, cwd=build_dir, interactive=True)
         UtilsUI.print_step_end("Compiling & Installing")
         return True
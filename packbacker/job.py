@@ -1,11 +1,32 @@
 __author__ = 'Christof Pieloth'
 
+import datetime
 import logging
 import os
+import re
 
+from packbacker.artifacts import ArtifactCache
+from packbacker.ccache import CompilerCache
+from packbacker.constants import Fetch
+from packbacker.constants import Keep
+from packbacker.constants import Parameter
+from packbacker.constants import PlanState
+from packbacker.constants import Step
+from packbacker.errors import DependencyError
+from packbacker.errors import JobFileError
 from packbacker.errors import ParameterError
-from packbacker.installer import Installer
+from packbacker.footprint import Footprint
+from packbacker.installer import InstallerIndex
+from packbacker.jobparser import JobParser
+from packbacker.lockfile import Lockfile
+from packbacker.parallelism import JobServer
+from packbacker.parallelism import Parallelism
+from packbacker.progress import Progress
+from packbacker.remote import RemotePool
+from packbacker.scheduler import Scheduler
+from packbacker.toolchain import Toolchain
 from packbacker.utils import UtilsUI
+from packbacker.vcs import MirrorCache
 
 
 class Job(object):
@@ -14,66 +35,280 @@ class Job(object):
 
     def __init__(self):
         self._installers = []
+        self._lines = {}
 
-    def add_installer(self, installer):
+    def add_installer(self, installer, name=None, params=None):
+        """Adds the installer. name and params of its job line are required for remote execution."""
         self._installers.append(installer)
+        self._lines[installer] = (name or installer.name, params or {})
 
-    def execute(self):
-        errors = 0
-        for i in self._installers:
-            if not UtilsUI.ask_for_execute('Install ' + i.label):
-                continue
+    def execute(self, workers=1, fetch_workers=0):
+        """
+        Executes the installers with up to workers installers at the same time.
+        If fetch_workers > 0, downloads are executed in a separate pool and overlap with the compile steps.
+        """
+        self._probe_tools()
+        scheduler = Scheduler(self._installers, workers)
+        if scheduler.workers > 1:
+            # Concurrent compile steps share the jobs and the counters of the compiler cache.
+            JobServer.start(Parallelism.default_jobs())
+            CompilerCache.begin_job(self._installers)
+        Progress.start()
+        try:
+            if fetch_workers > 0:
+                errors = self._execute_pipelined(scheduler, fetch_workers)
+            else:
+                errors = scheduler.run(Job._execute_installer)
+        finally:
+            Progress.stop()
+            JobServer.stop()
+        CompilerCache.end_job()
+        MirrorCache.print_statistics()
+        ArtifactCache.print_statistics()
+        Footprint.print_statistics()
+        return errors
 
-            try:
-                if i.install():
-                    Job.log.info(i.name + ' executed.')
-                else:
-                    errors += 1
-                    Job.log.error('Error on executing ' + i.name + '!')
-            except Exception as ex:
-                errors += 1
-                Job.log.error('Unknown error:\n' + str(ex))
+    def execute_remote(self, addresses, token=None):
+        """Executes the installers on the workers at the addresses, e.g. 'host:7600'."""
+        try:
+            pool = RemotePool(addresses, token)
+        except (IOError, OSError, ValueError) as err:
+            Job.log.critical('Could not connect to workers: ' + str(err))
+            return len(self._installers)
+
+        # Ask before the start, the workers do not ask any questions.
+        selected = [i for i in self._installers if Job._confirm(i)]
+
+        def install(installer):
+            if installer not in selected:
+                return True
+            name, params = self._lines[installer]
+            # The worker installs to the same absolute path, not to its home folder.
+            params = dict(params)
+            params[Parameter.DEST_DIR] = installer.arg_dest
+            if installer.arg_revision:
+                params[Parameter.REVISION] = installer.arg_revision
+            return Job._execute_stage(installer, lambda: pool.install(installer, name, params), 'executed')
+
+        try:
+            errors = Scheduler(self._installers, len(pool)).run(install)
+        finally:
+            pool.close()
         return errors
 
+    def plan(self):
+        """Prints the steps, which would be executed, with the estimated durations from previous runs."""
+        self._probe_tools()
+        total = 0
+        unknown = 0
+        for installer in Scheduler.order(self._installers):
+            UtilsUI.print(installer.name + ' (' + installer.label + '): ' + installer.arg_dest)
+            for step, action, state, estimate in installer.plan():
+                line = '  ' + state.ljust(8) + action
+                if state == PlanState.RUN:
+                    if estimate is None:
+                        unknown += 1
+                        line += ' (unknown duration)'
+                    else:
+                        total += estimate
+                        line += ' (~' + Job._format_duration(estimate) + ')'
+                UtilsUI.print(line)
+        summary = 'Estimated duration: ' + Job._format_duration(total)
+        if unknown:
+            summary += ' + ' + str(unknown) + ' steps without previous runs'
+        UtilsUI.print(summary)
+
+    def lock(self, fname):
+        """Resolves the versions of the installers to commit IDs and writes them to the lockfile."""
+        errors = 0
+        commits = Lockfile.resolve(self._installers)
+        for installer, commit in commits.items():
+            if commit is None:
+                Job.log.error('Could not resolve ' + installer.name + ' ' + installer.arg_version + ': ' +
+                              installer.REPO_URL)
+                errors += 1
+            else:
+                UtilsUI.print(installer.name + ' ' + installer.arg_version + ': ' + commit)
+        if errors:
+            return errors
+        try:
+            Lockfile.write(fname, commits)
+        except (IOError, OSError) as err:
+            Job.log.error('Could not write lockfile ' + fname + ': ' + str(err))
+            return 1
+        UtilsUI.print('Lockfile written: ' + fname)
+        return 0
+
+    def _probe_tools(self):
+        """Finds the programs of all installers at once, instead of one after the other in each installer."""
+        Toolchain.probe([t for i in self._installers for t in i.tools()] + ['make'])
+
     @staticmethod
-    def read_job(fname):
-        path = os.path.dirname(os.path.realpath(__file__))
-        prototypes = Installer.load_prototypes(os.path.join(path, 'installers'))
+    def _format_duration(seconds):
+        return str(datetime.timedelta(seconds=int(round(seconds))))
+
+    def _execute_pipelined(self, scheduler, fetch_workers):
+        # Ask before the start, so the questions do not interrupt the downloads.
+        selected = [i for i in self._installers if Job._confirm(i)]
+
+        def fetch(installer):
+            return installer not in selected or Job._execute_stage(installer, installer.fetch, 'fetched')
+
+        def build(installer):
+            return installer not in selected or Job._execute_stage(installer, installer.build, 'executed')
+
+        return scheduler.run_pipelined(fetch, build, fetch_workers)
+
+    @staticmethod
+    def _confirm(installer):
+        return installer.arg_steps is not None or UtilsUI.ask_for_execute('Install ' + installer.label)
+
+    @staticmethod
+    def _execute_installer(installer):
+        if not Job._confirm(installer):
+            return True
+        return Job._execute_stage(installer, installer.install, 'executed')
+
+    @staticmethod
+    def _execute_stage(installer, stage, done):
+        try:
+            if stage():
+                Job.log.info(installer.name + ' ' + done + '.')
+                return True
+            else:
+                Job.log.error('Error on executing ' + installer.name + '!')
+                return False
+        except Exception as ex:
+            Job.log.error('Unknown error:\n' + str(ex))
+            return False
+
+    @staticmethod
+    def read_job(fname, lockfile=True):
+        """Returns the job of the file, the installers are pinned by the lockfile of the job (optional)."""
+        index = Job.installer_index()
 
-        job = None
         try:
-            job_file = open(fname, 'r')
+            entries = JobParser().parse(fname)
         except IOError as err:
             Job.log.critical('Error on reading job file:\n' + str(err))
-        else:
-            with job_file:
-                job = Job()
-                for line in job_file:
-                    if line[0] == '#':
-                        continue
-                    for p in prototypes:
-                        if p.matches(line):
-                            try:
-                                params = Job.read_parameter(line)
-                                cmd = p.instance(params)
-                                job.add_installer(cmd)
-                            except ParameterError as err:
-                                Job.log.error("Installer '" + p.name + "' is skipped: " + str(err))
-                            except Exception as ex:
-                                Job.log.critical('Unknown error: \n' + str(ex))
-                            continue
+            return None
+        except JobFileError as err:
+            Job.log.critical('Error on reading job file: ' + err.msg)
+            return None
+
+        job = Job()
+        destinations = set()
+        for entry in entries:
+            p = index.prototype(entry.name)
+            if p is None:
+                Job.log.critical(entry.location + ": Unknown installer '" + entry.name + "'")
+                return None
+            try:
+                cmd = p.instance(entry.params)
+                Job.read_common_parameters(cmd, entry.params)
+                if (cmd.name, cmd.arg_dest) in destinations:
+                    raise ParameterError('already installed to ' + cmd.arg_dest + ', use another ' +
+                                         Parameter.DEST_DIR + ' for each version')
+                destinations.add((cmd.name, cmd.arg_dest))
+                job.add_installer(cmd, entry.name, entry.params)
+            except ParameterError as err:
+                Job.log.error(entry.location + ": Installer '" + p.name + "' is skipped: " + str(err))
+            except Exception as ex:
+                Job.log.critical('Unknown error: \n' + str(ex))
+
+        try:
+            Scheduler.check_dependencies(job._installers)
+        except DependencyError as err:
+            Job.log.critical('Error on reading job file: ' + str(err))
+            return None
+
+        if lockfile:
+            try:
+                Lockfile.apply(Lockfile.fname(fname), job._installers)
+            except JobFileError as err:
+                Job.log.critical('Error on reading job file: ' + err.msg)
+                return None
 
         return job
 
+    @staticmethod
+    def installer_index():
+        """Returns the index of the installers, which are shipped with PackBacker."""
+        path = os.path.dirname(os.path.realpath(__file__))
+        return InstallerIndex(os.path.join(path, 'installers'))
+
+    @staticmethod
+    def create_installer(name, params):
+        """Returns the installer of a job line, e.g. for a worker. Raises a ParameterError."""
+        p = Job.installer_index().prototype(name)
+        if p is None:
+            raise ParameterError("Unknown installer '" + name + "'")
+        installer = p.instance(params)
+        Job.read_common_parameters(installer, params)
+        return installer
+
+    @staticmethod
+    def read_common_parameters(installer, params):
+        """Sets the parameters, which are supported by all installers."""
+        if Parameter.COMPILER_CACHE in params:
+            tool = params[Parameter.COMPILER_CACHE]
+            if tool not in CompilerCache.ALL:
+                raise ParameterError("Unknown compiler cache '" + tool + "', expected one of: " +
+                                     ', '.join(CompilerCache.ALL))
+            installer.arg_compiler_cache = tool
+        if Parameter.REVISION in params:
+            revision = params[Parameter.REVISION].strip().lower()
+            if not MirrorCache.COMMIT_ID.match(revision):
+                raise ParameterError("Invalid revision '" + revision + "', expected a commit ID with 40 hex digits")
+            installer.arg_revision = revision
+        if Parameter.DEPENDS in params:
+            depends = params[Parameter.DEPENDS].split(',')
+            installer.arg_depends = [d.strip() for d in depends if d.strip()]
+        if Parameter.FETCH in params:
+            fetch = params[Parameter.FETCH].strip()
+            if fetch not in Fetch.ALL:
+                raise ParameterError("Unknown fetch mode '" + fetch + "', expected one of: " + ', '.join(Fetch.ALL))
+            if fetch not in installer.FETCH_MODES:
+                raise ParameterError("Fetch mode '" + fetch + "' is not supported, expected one of: " +
+                                     ', '.join(installer.FETCH_MODES))
+            installer.arg_fetch = fetch
+        if Parameter.ARCHIVE in params:
+            installer.arg_archive = params[Parameter.ARCHIVE].strip()
+        if Parameter.SHA256 in params:
+            sha256 = params[Parameter.SHA256].strip().lower()
+            if not re.match(r'^[0-9a-f]{64}$', sha256):
+                raise ParameterError("Invalid SHA-256 '" + sha256 + "', expected 64 hex digits")
+            installer.arg_sha256 = sha256
+        if installer.arg_fetch == Fetch.ARCHIVE and installer.archive_url is None:
+            raise ParameterError(Parameter.ARCHIVE + ' parameter is missing for fetch=' + Fetch.ARCHIVE + '!')
+        if installer.arg_fetch == Fetch.ARCHIVE and installer.arg_sha256 is None:
+            # Archives are only installed, if they are verified.
+            raise ParameterError(Parameter.SHA256 + ' parameter is missing for fetch=' + Fetch.ARCHIVE + '!')
+        if Parameter.STEPS in params:
+            steps = [s.strip() for s in params[Parameter.STEPS].split(',') if s.strip()]
+            for s in steps:
+                if s not in Step.ALL:
+                    raise ParameterError("Unknown step '" + s + "', expected one of: " + ', '.join(Step.ALL))
+            installer.arg_steps = steps
+        if Parameter.KEEP in params:
+            keep = [k.strip() for k in params[Parameter.KEEP].split(',') if k.strip()]
+            if not keep:
+                raise ParameterError(Parameter.KEEP + " parameter is empty, expected some of: " + ', '.join(Keep.ALL))
+            for k in keep:
+                if k not in Keep.ALL:
+                    raise ParameterError("Unknown part '" + k + "', expected one of: " + ', '.join(Keep.ALL))
+            installer.arg_keep = keep
+        if Parameter.TIMEOUT in params:
+            try:
+                timeout = float(params[Parameter.TIMEOUT])
+            except ValueError:
+                timeout = 0
+            if timeout <= 0:
+                raise ParameterError("Invalid timeout '" + params[Parameter.TIMEOUT] + "', expected seconds > 0")
+            installer.arg_timeout = timeout
+
     @staticmethod
     def read_parameter(line):
-        params = {}
-        i = line.find(': ') + 2
-        line = line[i:]
-        pairs = line.split(';')
-        for pair in pairs:
-            pair = pair.strip()
-            par = pair.split('=')
-            if len(par) == 2:
-                params[par[0]] = par[1]
-        return params
\ No newline at end of file
+        """Returns the parameters of a job line. Raises a JobFileError on syntax errors."""
+        i = line.find(':') + 1
+        return JobParser.parse_parameters(line[i:])
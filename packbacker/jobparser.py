@@ -0,0 +1,90 @@
+__author__ = 'Christof Pieloth'
+
+import os
+import re
+
+from packbacker.errors import JobFileError
+
+
+class JobEntry(object):
+    """An installer line of a job file."""
+
+    def __init__(self, name, params, location):
+        self.name = name
+        self.params = params
+        self.location = location
+
+    def __repr__(self):
+        return self.location + ': ' + self.name
+
+
+class JobParser(object):
+    """
+    Parser for job files:
+    <installer>: <key>=<value>; <key>=<value>; ...
+    include <job file>
+    # Comment
+    """
+
+    COMMENT = '#'
+
+    INSTALLER_LINE = re.compile(r'^([A-Za-z0-9_.+-]+)\s*:(.*)$')
+    INCLUDE_LINE = re.compile(r'^include\s+(.+)$')
+    KEY = re.compile(r'^[A-Za-z0-9_]+$')
+
+    def parse(self, fname):
+        """Returns the JobEntry's of the file and its includes. Raises JobFileError or IOError."""
+        entries = []
+        self._parse_file(os.path.realpath(os.path.expanduser(fname)), entries, [])
+        return entries
+
+    def _parse_file(self, fname, entries, includes):
+        if fname in includes:
+            raise JobFileError('Cyclic include of ' + fname + ' in ' + includes[-1])
+        includes.append(fname)
+
+        with open(fname, 'r') as job_file:
+            for lineno, line in enumerate(job_file, 1):
+                line = line.strip()
+                if not line or line.startswith(JobParser.COMMENT):
+                    continue
+                location = fname + ':' + str(lineno)
+
+                match = JobParser.INSTALLER_LINE.match(line)
+                if match:
+                    name = match.group(1).lower()
+                    entries.append(JobEntry(name, JobParser.parse_parameters(match.group(2), location), location))
+                    continue
+
+                match = JobParser.INCLUDE_LINE.match(line)
+                if match:
+                    include = os.path.expanduser(match.group(1).strip())
+                    include = os.path.realpath(os.path.join(os.path.dirname(fname), include))
+                    try:
+                        self._parse_file(include, entries, includes)
+                    except IOError as err:
+                        raise JobFileError(location + ': Could not include ' + include + ': ' + str(err))
+                    continue
+
+                raise JobFileError(location + ": Expected '<installer>: <key>=<value>; ...' or 'include <file>'")
+
+        includes.pop()
+
+    @staticmethod
+    def parse_parameters(text, location='<string>'):
+        """Parses 'key=value; key=value; ...' to a dictionary, a value may contain '='."""
+        params = {}
+        for pair in text.split(';'):
+            pair = pair.strip()
+            if not pair:
+                continue
+            if '=' not in pair:
+                raise JobFileError(location + ": Expected '<key>=<value>', got '" + pair + "'")
+            key, value = pair.split('=', 1)
+            key = key.strip()
+            if not JobParser.KEY.match(key):
+                raise JobFileError(location + ": Invalid parameter name '" + key + "'")
+            if key in params:
+                raise JobFileError(location + ": Duplicate parameter '" + key + "'")
+            params[key] = value.strip()
+        return params
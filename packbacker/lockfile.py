@@ -0,0 +1,108 @@
+__author__ = 'Christof Pieloth'
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+
+from packbacker.constants import Fetch
+from packbacker.constants import Vcs
+from packbacker.errors import JobFileError
+from packbacker.vcs import Git
+from packbacker.vcs import Hg
+
+
+class Lockfile(object):
+    """
+    Commit IDs of the versions of a job, e.g. jobs/myjob.pb.lock for jobs/myjob.pb.
+    With a lockfile, a job checks out the same commits, even if a tag or branch was moved in the meantime.
+    """
+
+    log = logging.getLogger(__name__)
+
+    VERSION = 1
+    SUFFIX = '.lock'
+    MAX_WORKERS = 8  # URLs which are resolved at the same time
+
+    @staticmethod
+    def fname(job_fname):
+        """Returns the lockfile of the job file."""
+        return job_fname + Lockfile.SUFFIX
+
+    @staticmethod
+    def lockable(installer):
+        """Checks if the version of the installer is checked out from a repository, i.e. not a release archive."""
+        return installer.REPO_URL is not None and installer.arg_version and installer.arg_fetch != Fetch.ARCHIVE
+
+    @staticmethod
+    def resolve(installers):
+        """
+        Returns a dictionary installer -> commit ID of its version, None if the version is unknown.
+        Each URL is resolved once, all URLs in parallel.
+        """
+        installers = [i for i in installers if Lockfile.lockable(i)]
+        revisions = collections.OrderedDict()
+        for i in installers:
+            versions = revisions.setdefault((i.VCS, i.REPO_URL), [])
+            if i.arg_version not in versions:
+                versions.append(i.arg_version)
+
+        def resolve(repo):
+            vcs, url = repo
+            return (Hg if vcs == Vcs.HG else Git).resolve(url, revisions[repo])
+
+        commits = {}
+        if revisions:
+            with ThreadPoolExecutor(max_workers=min(len(revisions), Lockfile.MAX_WORKERS)) as pool:
+                commits = dict(zip(revisions.keys(), pool.map(resolve, revisions.keys())))
+        return collections.OrderedDict((i, commits[(i.VCS, i.REPO_URL)][i.arg_version]) for i in installers)
+
+    @staticmethod
+    def write(fname, commits):
+        """
+        Writes the commit IDs of the installers, see resolve(). The destination folder is not part of an entry,
+        it is expanded for the current user, e.g. dest_dir=~, and the lockfile is shared with other users and hosts.
+        """
+        entries = collections.OrderedDict()
+        for i, commit in commits.items():
+            entries[Lockfile.__key(i.name, i.REPO_URL, i.arg_version)] = {
+                'installer': i.name, 'url': i.REPO_URL, 'version': i.arg_version, 'revision': commit}
+        entries = list(entries.values())
+        tmp_fname = fname + '.tmp-' + str(os.getpid())
+        with open(tmp_fname, 'w') as fd:
+            json.dump({'version': Lockfile.VERSION, 'entries': entries}, fd, indent=2, sort_keys=True)
+            fd.write('\n')
+        os.replace(tmp_fname, fname)
+
+    @staticmethod
+    def apply(fname, installers):
+        """
+        Pins the installers to the commit IDs of the lockfile, if it exists. Entries are looked up by installer,
+        URL and version, so entries of another version are ignored.
+        Raises a JobFileError if the lockfile can not be read.
+        """
+        if not os.path.exists(fname):
+            return
+        try:
+            with open(fname, 'r') as fd:
+                content = json.load(fd)
+            entries = dict((Lockfile.__key(e['installer'], e['url'], e['version']), e) for e in content['entries'])
+        except (IOError, ValueError, KeyError, TypeError) as err:
+            raise JobFileError('Invalid lockfile ' + fname + ': ' + str(err))
+        if content.get('version') != Lockfile.VERSION:
+            raise JobFileError('Unsupported version of lockfile ' + fname + ': ' + str(content.get('version')))
+
+        for i in installers:
+            if not Lockfile.lockable(i) or i.arg_revision:
+                continue
+            entry = entries.get(Lockfile.__key(i.name, i.REPO_URL, i.arg_version))
+            if entry and entry['revision']:
+                i.arg_revision = entry['revision']
+            else:
+                Lockfile.log.warning(i.name + ' ' + str(i.arg_version) + ' is not pinned by ' + fname +
+                                     ', update it with --lock')
+
+    @staticmethod
+    def __key(name, url, version):
+        return name, url, version
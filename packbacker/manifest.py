@@ -0,0 +1,112 @@
+__author__ = 'Christof Pieloth'
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+
+class StateManifest(object):
+    """
+    Records the finished installation steps in the destination folder.
+    A step is done, if it finished successfully with the same inputs (fingerprint) as requested.
+    """
+
+    log = logging.getLogger(__name__)
+
+    FILE_NAME = '.packbacker-state.json'
+    LOCK_SUFFIX = '.lock'
+
+    enabled = True
+
+    # Threads of this process, other processes are excluded by a lock file, see _locked().
+    _lock = threading.Lock()
+
+    def __init__(self, dest_dir):
+        self._fname = os.path.join(dest_dir, StateManifest.FILE_NAME)
+
+    @property
+    def fname(self):
+        return self._fname
+
+    def is_done(self, installer, step, fingerprint):
+        """Checks if the step of the installer is finished with the same fingerprint."""
+        if not StateManifest.enabled:
+            return False
+        with StateManifest._lock:
+            steps = self._read().get(installer, {}).get('steps', {})
+        return step in steps and steps[step]['fingerprint'] == fingerprint
+
+    def recorded(self, installer, step):
+        """Checks if the step of the installer was finished before, regardless of its inputs."""
+        with StateManifest._lock:
+            return step in self._read().get(installer, {}).get('steps', {})
+
+    def set_done(self, installer, version, step, fingerprint):
+        """Records the step of the installer as finished."""
+        with self._locked():
+            state = self._read()
+            entry = state.setdefault(installer, {'steps': {}})
+            entry['version'] = version
+            entry['steps'][step] = {'fingerprint': fingerprint, 'finished': time.time()}
+            self._write(state)
+
+    def reset(self, installer, step):
+        """Removes the step of the installer, e.g. after it failed."""
+        with self._locked():
+            state = self._read()
+            if step in state.get(installer, {}).get('steps', {}):
+                del state[installer]['steps'][step]
+                self._write(state)
+
+    def entry(self, installer):
+        """Returns the recorded state of the installer, e.g. to transfer it to another destination folder."""
+        with StateManifest._lock:
+            return self._read().get(installer)
+
+    def set_entry(self, installer, entry):
+        """Replaces the recorded state of the installer."""
+        with self._locked():
+            state = self._read()
+            state[installer] = entry
+            self._write(state)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Locks the manifest for a read-modify-write. The manifest is shared by all installers of the destination folder,
+        which can be installed by several processes at the same time, see InstallLock.
+        """
+        with StateManifest._lock:
+            try:
+                fd = os.open(self._fname + StateManifest.LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as err:
+                StateManifest.log.warning('Could not lock state manifest ' + self._fname + ': ' + str(err))
+                fd = None
+            try:
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                if fd is not None:
+                    # Closing releases the lock.
+                    os.close(fd)
+
+    def _read(self):
+        try:
+            with open(self._fname, 'r') as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return {}
+
+    def _write(self, state):
+        tmp_fname = self._fname + '.tmp-' + str(os.getpid())
+        try:
+            with open(tmp_fname, 'w') as fd:
+                json.dump(state, fd, indent=2, sort_keys=True)
+            os.replace(tmp_fname, self._fname)
+        except (IOError, OSError) as err:
+            StateManifest.log.warning('Could not write state manifest ' + self._fname + ': ' + str(err))
@@ -0,0 +1,239 @@
+__author__ = 'Christof Pieloth'
+
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from packbacker.toolchain import Toolchain
+from packbacker.utils import UtilsUI
+
+
+class Parallelism(object):
+    """Detects the number of parallel compile jobs from the CPUs, the cgroup CPU quota and the free memory."""
+
+    log = logging.getLogger(__name__)
+
+    MEMORY_PER_JOB = 1024 ** 3  # bytes, rough estimate for a C++ compiler process
+
+    # Number of jobs set by the user, None for automatic detection.
+    jobs = None
+
+    @staticmethod
+    def cpu_count():
+        """Number of CPUs this process may use."""
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @staticmethod
+    def cpu_quota():
+        """CPU quota of the cgroup, e.g. 2.5 CPUs, or None if there is no limit."""
+        # cgroup v2
+        try:
+            with open('/sys/fs/cgroup/cpu.max', 'r') as fd:
+                quota, period = fd.read().split()[:2]
+            if quota != 'max':
+                return int(quota) / int(period)
+            return None
+        except (IOError, ValueError):
+            pass
+        # cgroup v1
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r') as fd:
+                quota = int(fd.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r') as fd:
+                period = int(fd.read())
+            if quota > 0:
+                return quota / period
+        except (IOError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def available_memory():
+        """Available memory in bytes or None if unknown."""
+        try:
+            with open('/proc/meminfo', 'r') as fd:
+                for line in fd:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except (IOError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def default_jobs():
+        """Number of parallel compile jobs: set by the user or derived from CPUs, CPU quota and memory."""
+        if Parallelism.jobs:
+            return Parallelism.jobs
+
+        cpus = Parallelism.cpu_count()
+        jobs = cpus
+        quota = Parallelism.cpu_quota()
+        if quota is not None:
+            jobs = min(jobs, int(math.ceil(quota)))
+        memory = Parallelism.available_memory()
+        if memory is not None:
+            jobs = min(jobs, memory // Parallelism.MEMORY_PER_JOB)
+        jobs = max(1, int(jobs))
+        Parallelism.log.debug('cpus=' + str(cpus) + ', quota=' + str(quota) + ', memory=' + str(memory) +
+                              ' -> jobs=' + str(jobs))
+        return jobs
+
+
+class JobServer(object):
+    """
+    GNU make jobserver, which is shared by all compile steps of a job, so concurrent builds never oversubscribe.
+    The tokens are kept in a named pipe, which is also supported by Ninja (>= 1.13) and GNU make (>= 4.4).
+    """
+
+    log = logging.getLogger(__name__)
+
+    # Jobserver of the running job, None if compile steps are not executed concurrently.
+    current = None
+
+    def __init__(self, jobs):
+        self._jobs = jobs
+        self._dir = tempfile.mkdtemp(prefix='packbacker-jobserver-')
+        self._fifo = os.path.join(self._dir, 'fifo')
+        os.mkfifo(self._fifo, 0o600)
+        self._fd = os.open(self._fifo, os.O_RDWR)
+        # Separate descriptor, so blocking reads of other threads are not affected.
+        self._nonblocking_fd = os.open(self._fifo, os.O_RDONLY | os.O_NONBLOCK)
+        os.write(self._fd, b'+' * jobs)
+
+    @property
+    def jobs(self):
+        return self._jobs
+
+    @property
+    def fifo(self):
+        return self._fifo
+
+    @property
+    def fd(self):
+        return self._fd
+
+    @staticmethod
+    def start(jobs):
+        JobServer.current = JobServer(jobs)
+        JobServer.log.info('Started jobserver with ' + str(jobs) + ' jobs: ' + JobServer.current.fifo)
+        return JobServer.current
+
+    @staticmethod
+    def stop():
+        if JobServer.current:
+            JobServer.current.close()
+            JobServer.current = None
+
+    def close(self):
+        os.close(self._nonblocking_fd)
+        os.close(self._fd)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def acquire(self):
+        """Takes a token, blocks until one is available."""
+        return os.read(self._fd, 1)
+
+    def try_acquire(self, count):
+        """Takes up to count tokens without blocking."""
+        if count < 1:
+            return b''
+        try:
+            return os.read(self._nonblocking_fd, count)
+        except BlockingIOError:
+            return b''
+
+    def release(self, token):
+        os.write(self._fd, token)
+
+    def make_flags(self, fifo=True):
+        """MAKEFLAGS for the clients. Without fifo, the file descriptor is passed for GNU make < 4.4."""
+        if fifo:
+            return ' -j' + str(self._jobs) + ' --jobserver-auth=fifo:' + self._fifo
+        fds = str(self._fd) + ',' + str(self._fd)
+        return ' -j' + str(self._jobs) + ' --jobserver-fds=' + fds + ' --jobserver-auth=' + fds
+
+
+class Make(object):
+    """Calls make with the detected parallelism or as client of the shared jobserver."""
+
+    _lock = threading.Lock()
+    _fifo_support = None
+
+    @staticmethod
+    def call(ctx, cwd, label, args=()):
+        """
+        Calls make in cwd with the environment of the context, label is used to log the parallelism.
+        Raises a CommandError if make fails.
+        """
+        server = JobServer.current
+        if server is None:
+            jobs = UtilsUI.ask_for_make_jobs(Parallelism.default_jobs())
+            UtilsUI.print(label + ': make -j' + str(jobs))
+            ctx.check(['make', '-j' + str(jobs)] + list(args), cwd=cwd)
+            return
+
+        fifo = Make.supports_fifo()
+        env = dict(ctx.env or os.environ)
+        env['MAKEFLAGS'] = server.make_flags(fifo)
+        # The token covers the implicit job slot of this make process.
+        token = server.acquire()
+        try:
+            UtilsUI.print(label + ': make via shared jobserver, ' + str(server.jobs) + ' jobs for all installers')
+            ctx.check(['make'] + list(args), cwd=cwd, env=env, pass_fds=() if fifo else (server.fd,))
+        finally:
+            server.release(token)
+
+    @staticmethod
+    def supports_fifo():
+        """Checks if make supports a named pipe as jobserver (GNU make >= 4.4)."""
+        with Make._lock:
+            if Make._fifo_support is None:
+                match = re.search(r'(\d+)\.(\d+)', Toolchain.version('make') or '')
+                Make._fifo_support = bool(match) and (int(match.group(1)), int(match.group(2))) >= (4, 4)
+            return Make._fifo_support
+
+
+class Ninja(object):
+    """Calls ninja with the detected parallelism or as client of the shared jobserver."""
+
+    @staticmethod
+    def call(ctx, cwd, label, args=()):
+        """
+        Calls ninja in cwd with the environment of the context, label is used to log the parallelism.
+        Raises a CommandError if ninja fails.
+        """
+        server = JobServer.current
+        if server is None:
+            jobs = UtilsUI.ask_for_make_jobs(Parallelism.default_jobs())
+            UtilsUI.print(label + ': ninja -j' + str(jobs))
+            ctx.check(['ninja', '-j' + str(jobs)] + list(args), cwd=cwd)
+            return
+
+        # The token covers the implicit job slot of this ninja process.
+        tokens = server.acquire()
+        try:
+            if Ninja.supports_jobserver():
+                env = dict(ctx.env or os.environ)
+                env['MAKEFLAGS'] = server.make_flags(fifo=True)
+                UtilsUI.print(label + ': ninja via shared jobserver, ' + str(server.jobs) + ' jobs for all installers')
+                ctx.check(['ninja'] + list(args), cwd=cwd, env=env)
+            else:
+                # Older ninja can not be a client, so it gets the tokens which are free right now.
+                tokens += server.try_acquire(server.jobs - 1)
+                UtilsUI.print(label + ': ninja -j' + str(len(tokens)) + ' from shared jobserver')
+                ctx.check(['ninja', '-j' + str(len(tokens))] + list(args), cwd=cwd)
+        finally:
+            server.release(tokens)
+
+    @staticmethod
+    def supports_jobserver():
+        """Checks if ninja is a client of the jobserver (Ninja >= 1.13)."""
+        match = re.search(r'(\d+)\.(\d+)', Toolchain.version('ninja') or '')
+        return bool(match) and (int(match.group(1)), int(match.group(2))) >= (1, 13)
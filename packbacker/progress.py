@@ -0,0 +1,210 @@
+__author__ = 'Christof Pieloth'
+
+import collections
+import contextlib
+import datetime
+import logging
+import shutil
+import sys
+import threading
+import time
+
+
+class Task(object):
+    """A running installer of the Progress view: current step and the last lines of its output."""
+
+    def __init__(self, name):
+        self.name = name
+        self.step = None
+        self.start = time.time()
+        self.step_start = self.start
+        # Command log of the installer, which writes the complete output to disk.
+        self.log = None
+        self.lines = collections.deque(maxlen=Progress.BUFFER_LINES)
+
+    def append(self, text):
+        for line in text.splitlines():
+            if line.strip():
+                self.lines.append(line.rstrip())
+
+    @property
+    def last_line(self):
+        return self.lines[-1] if self.lines else ''
+
+
+class ProgressHandler(logging.Handler):
+    """Prints warnings and errors above the status lines of the Progress view."""
+
+    def emit(self, record):
+        try:
+            Progress.write(self.format(record), True)
+        except Exception:
+            self.handleError(record)
+
+
+class Progress(object):
+    """
+    Output of concurrently running installers.
+    Live view on a terminal: one status line per installer with its step, elapsed time and latest output line.
+    Messages of the installers are written to their logs, only errors and environment variables are printed.
+    Otherwise, each line of an installer is prefixed with its name, e.g. for log files of a CI server.
+    """
+
+    BUFFER_LINES = 100  # lines of output, which are kept per installer
+    REFRESH = 0.2  # seconds between redraws of the live view
+
+    # If False, the output is printed as is.
+    enabled = True
+    # Shows the live view, requires a terminal.
+    live = False
+
+    _tasks = collections.OrderedDict()
+    _local = threading.local()
+    _lock = threading.RLock()
+    _stop = threading.Event()
+    _thread = None
+    _handler = None
+    _drawn = 0
+    _paused = False
+
+    @staticmethod
+    def start():
+        """Starts the live view, if it is enabled."""
+        if not Progress.enabled or not Progress.live or Progress._thread is not None:
+            return
+        Progress._stop.clear()
+        Progress._handler = ProgressHandler(logging.WARNING)
+        logging.getLogger().addHandler(Progress._handler)
+        Progress._thread = threading.Thread(target=Progress.__refresh, name='progress')
+        Progress._thread.daemon = True
+        Progress._thread.start()
+
+    @staticmethod
+    def stop():
+        """Stops the live view and removes its status lines."""
+        if Progress._thread is None:
+            return
+        Progress._stop.set()
+        Progress._thread.join()
+        Progress._thread = None
+        logging.getLogger().removeHandler(Progress._handler)
+        Progress._handler = None
+        with Progress._lock:
+            Progress.__clear()
+            sys.stdout.flush()
+
+    @staticmethod
+    def running():
+        return Progress._thread is not None
+
+    @staticmethod
+    def begin(name):
+        """Adds a task for the installer, which is executed by the current thread."""
+        task = Task(name)
+        with Progress._lock:
+            Progress._tasks[task] = None
+        Progress._local.task = task
+        return task
+
+    @staticmethod
+    def end(task, success):
+        """Removes the task and prints its result."""
+        with Progress._lock:
+            Progress._tasks.pop(task, None)
+            if Progress.enabled:
+                result = 'finished' if success else 'failed'
+                Progress.write(result + ' after ' + Progress.__format_duration(time.time() - task.start), True)
+        Progress._local.task = None
+
+    @staticmethod
+    def current():
+        """Returns the task of the current thread or None."""
+        return getattr(Progress._local, 'task', None)
+
+    @staticmethod
+    def step(action):
+        """Sets the step of the task of the current thread."""
+        task = Progress.current()
+        if task:
+            task.step = action
+            task.step_start = time.time()
+
+    @staticmethod
+    def compact():
+        """Checks if decorations, e.g. separators and blank lines, are omitted for the current thread."""
+        return Progress.enabled and Progress.current() is not None
+
+    @staticmethod
+    def write(text, show=False):
+        """
+        Prints a message. Messages of an installer are prefixed with its name or, in the live view, are written
+        to its log. show prints it in the live view, too.
+        """
+        task = Progress.current() if Progress.enabled else None
+        if task is None:
+            Progress.__print(text)
+            return
+        if Progress.running() and not show:
+            if task.log:
+                task.log.write(text + '\n')
+            else:
+                task.append(text)
+            return
+        lines = ['[' + task.name + '] ' + line for line in text.splitlines() if line.strip()]
+        if lines:
+            Progress.__print('\n'.join(lines))
+
+    @staticmethod
+    @contextlib.contextmanager
+    def paused():
+        """Removes the status lines until the end of the with statement, e.g. while a question is asked."""
+        with Progress._lock:
+            Progress.__clear()
+            sys.stdout.flush()
+            Progress._paused = True
+            try:
+                yield
+            finally:
+                Progress._paused = False
+
+    @staticmethod
+    def __print(text):
+        with Progress._lock:
+            Progress.__clear()
+            print(text)
+            Progress.__draw()
+            sys.stdout.flush()
+
+    @staticmethod
+    def __refresh():
+        while not Progress._stop.wait(Progress.REFRESH):
+            with Progress._lock:
+                Progress.__clear()
+                Progress.__draw()
+                sys.stdout.flush()
+
+    @staticmethod
+    def __clear():
+        if Progress._drawn:
+            # Moves the cursor to the first status line and clears the screen from there.
+            sys.stdout.write('\x1b[' + str(Progress._drawn) + 'F\x1b[J')
+            Progress._drawn = 0
+
+    @staticmethod
+    def __draw():
+        if not Progress.running() or Progress._paused:
+            return
+        columns = shutil.get_terminal_size().columns - 1
+        now = time.time()
+        lines = []
+        for task in Progress._tasks:
+            line = task.name + ': ' + (task.step or 'starting') + ' (' + \
+                Progress.__format_duration(now - task.step_start) + ') ' + task.last_line
+            lines.append(line[:columns])
+        for line in lines:
+            sys.stdout.write(line + '\n')
+        Progress._drawn = len(lines)
+
+    @staticmethod
+    def __format_duration(seconds):
+        return str(datetime.timedelta(seconds=int(seconds)))
@@ -0,0 +1,301 @@
+__author__ = 'Christof Pieloth'
+
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import socketserver
+import tarfile
+import tempfile
+import threading
+
+from packbacker.archive import Archive
+from packbacker.command import Command
+from packbacker.command import CommandLog
+from packbacker.errors import ArchiveError
+from packbacker.errors import ParameterError
+from packbacker.manifest import StateManifest
+from packbacker.utils import UtilsUI
+
+
+class Protocol(object):
+    """
+    Messages between coordinator and workers: one JSON object per line, optionally followed by a binary payload.
+    The size of the payload is given by the 'size' field of the message.
+    """
+
+    VERSION = 1
+    CHUNK_SIZE = 1024 * 1024  # bytes
+
+    @staticmethod
+    def send(wfile, message, fname=None):
+        """Sends the message and the content of the file fname as payload."""
+        message = dict(message)
+        message['size'] = os.path.getsize(fname) if fname else 0
+        wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+        if fname:
+            with open(fname, 'rb') as fd:
+                shutil.copyfileobj(fd, wfile, Protocol.CHUNK_SIZE)
+        wfile.flush()
+
+    @staticmethod
+    def receive(rfile, fname=None):
+        """Returns the next message or None if the connection is closed. The payload is written to fname."""
+        line = rfile.readline()
+        if not line:
+            return None
+        message = json.loads(line.decode('utf-8'))
+        size = message.get('size', 0)
+        fd = open(fname, 'wb') if fname else None
+        try:
+            while size > 0:
+                chunk = rfile.read(min(size, Protocol.CHUNK_SIZE))
+                if not chunk:
+                    raise IOError('Connection closed while receiving payload')
+                if fd:
+                    fd.write(chunk)
+                size -= len(chunk)
+        finally:
+            if fd:
+                fd.close()
+        return message
+
+    @staticmethod
+    def parse_address(address, default_host='localhost'):
+        """Returns (host, port) of 'host:port' or 'port'."""
+        host, _, port = address.rpartition(':')
+        return host or default_host, int(port)
+
+    @staticmethod
+    def node():
+        """Identifies the machine, workers on the same machine share the destination folders."""
+        try:
+            with open('/etc/machine-id', 'r') as fd:
+                machine_id = fd.read().strip()
+        except IOError:
+            machine_id = ''
+        return socket.gethostname() + '/' + machine_id
+
+
+class Worker(socketserver.ThreadingTCPServer):
+    """
+    Executes installers for a coordinator. The installer is created from its job line by the factory,
+    i.e. factory(name, params), and installed to the same destination folder as on the coordinator.
+    If the coordinator runs on another machine, the outputs of the installer are sent back.
+    """
+
+    log = logging.getLogger(__name__)
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, factory, token=None):
+        socketserver.ThreadingTCPServer.__init__(self, address, _WorkerHandler)
+        self.factory = factory
+        self.token = token or ''
+
+    @staticmethod
+    def serve(address, factory, token=None):
+        """
+        Listens on the address, e.g. 'localhost:7600', until the process is stopped.
+        Raises a ParameterError if there is no token and the address is reachable from other machines.
+        """
+        host, port = Protocol.parse_address(address)
+        if not token and not Worker.loopback(host):
+            raise ParameterError('a token is required to listen on ' + address + ', except on loopback addresses')
+        server = Worker((host, port), factory, token)
+        UtilsUI.print('PackBacker worker listening on ' + address)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def loopback(host):
+        """Checks if all addresses of the host are loopback addresses, e.g. 'localhost' or '127.0.0.1'."""
+        if not host:
+            return False
+        try:
+            infos = socket.getaddrinfo(host, None)
+        except socket.gaierror:
+            return False
+        return all(ipaddress.ip_address(info[4][0].split('%')[0]).is_loopback for info in infos)
+
+    def install(self, message, wfile):
+        result = {'type': 'result', 'success': False, 'log': '', 'manifest': None}
+        try:
+            installer = self.factory(message['name'], message['params'])
+        except ParameterError as err:
+            result['log'] = "Installer '" + message['name'] + "' is skipped: " + str(err)
+            Protocol.send(wfile, result)
+            return
+
+        result['success'] = installer.install()
+        log_fname = CommandLog(installer.name, installer.arg_dest).fname
+        try:
+            with open(log_fname, 'r') as fd:
+                result['log'] = fd.read()
+        except IOError:
+            pass
+        result['manifest'] = StateManifest(installer.arg_dest).entry(installer.name)
+
+        if not (message.get('transfer') and result['success']):
+            Protocol.send(wfile, result)
+            return
+
+        fd, fname = tempfile.mkstemp(prefix='packbacker-outputs-', suffix='.tar.gz')
+        os.close(fd)
+        try:
+            with tarfile.open(fname, 'w:gz', compresslevel=1) as tar:
+                for p in installer.outputs():
+                    if os.path.exists(os.path.join(installer.arg_dest, p)):
+                        tar.add(os.path.join(installer.arg_dest, p), arcname=p)
+            Protocol.send(wfile, result, fname)
+        finally:
+            os.remove(fname)
+
+
+class _WorkerHandler(socketserver.StreamRequestHandler):
+    """Connection to a coordinator: handshake, then one installer after the other."""
+
+    def handle(self):
+        hello = Protocol.receive(self.rfile)
+        if hello is None:
+            return
+        if not hmac.compare_digest(hello.get('token', '').encode('utf-8'), self.server.token.encode('utf-8')):
+            Worker.log.warning('Rejected coordinator with invalid token: ' + str(self.client_address))
+            Protocol.send(self.wfile, {'type': 'error', 'error': 'invalid token'})
+            return
+        Protocol.send(self.wfile, {'type': 'hello', 'version': Protocol.VERSION, 'node': Protocol.node()})
+
+        while True:
+            message = Protocol.receive(self.rfile)
+            if message is None:
+                break
+            if message.get('type') == 'install':
+                Worker.log.info('Installing ' + message['name'] + ' for ' + str(self.client_address))
+                self.server.install(message, self.wfile)
+
+
+class RemoteWorker(object):
+    """Connection of the coordinator to a worker."""
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, address, token=None):
+        self._address = address
+        self._sock = socket.create_connection(Protocol.parse_address(address))
+        self._rfile = self._sock.makefile('rb')
+        self._wfile = self._sock.makefile('wb')
+        Protocol.send(self._wfile, {'type': 'hello', 'version': Protocol.VERSION, 'token': token or ''})
+        hello = Protocol.receive(self._rfile)
+        if hello is None or hello.get('type') != 'hello':
+            error = hello.get('error') if hello else 'connection closed'
+            self.close()
+            raise IOError('Worker ' + address + ' refused connection: ' + error)
+        if hello.get('version') != Protocol.VERSION:
+            self.close()
+            raise IOError('Worker ' + address + ' uses protocol version ' + str(hello.get('version')))
+        # Workers on this machine install directly to the destination folder.
+        self._shared = hello.get('node') == Protocol.node()
+
+    @property
+    def address(self):
+        return self._address
+
+    def install(self, installer, name, params):
+        """Installs the installer, which is created from the job line name: params, on the worker."""
+        UtilsUI.print('Installing ' + installer.label + ' on worker ' + self._address)
+        Protocol.send(self._wfile, {'type': 'install', 'name': name, 'params': params,
+                                    'transfer': not self._shared})
+        fd, fname = tempfile.mkstemp(prefix='packbacker-outputs-', suffix='.tar.gz')
+        os.close(fd)
+        try:
+            result = Protocol.receive(self._rfile, fname)
+            if result is None:
+                raise IOError('Worker ' + self._address + ' closed the connection')
+            if not self._shared:
+                self.__apply(installer, result, fname)
+        finally:
+            os.remove(fname)
+
+        if not result['success']:
+            UtilsUI.print_error(installer.label + ' failed on worker ' + self._address + ':')
+            for line in result['log'].splitlines()[-Command.TAIL_LINES:]:
+                UtilsUI.print_error('  ' + line)
+        return result['success']
+
+    def __apply(self, installer, result, fname):
+        """Extracts the outputs and stores log and state manifest of the worker in the destination folder."""
+        if result['size'] > 0:
+            try:
+                Archive.extract(fname, installer.arg_dest)
+            except ArchiveError as err:
+                RemoteWorker.log.error('Could not extract outputs of ' + installer.name + ': ' + err.msg)
+                result['success'] = False
+        with CommandLog(installer.name, installer.arg_dest) as cmd_log:
+            cmd_log.write(result['log'])
+        if result['manifest']:
+            StateManifest(installer.arg_dest).set_entry(installer.name, result['manifest'])
+
+    def close(self):
+        for f in (self._rfile, self._wfile):
+            try:
+                f.close()
+            except IOError:
+                pass
+        self._sock.close()
+
+
+class RemotePool(object):
+    """Workers of the coordinator. An installer is executed by the next idle worker."""
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, addresses, token=None):
+        self._workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._alive = 0
+        try:
+            for address in addresses:
+                worker = RemoteWorker(address, token)
+                self._workers.append(worker)
+                self._idle.put(worker)
+                self._alive += 1
+        except (IOError, OSError, ValueError):
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self._workers)
+
+    def install(self, installer, name, params):
+        """Installs the installer on the next idle worker. Returns False if it fails or no worker is left."""
+        worker = None
+        while worker is None:
+            try:
+                worker = self._idle.get(timeout=1)
+            except queue.Empty:
+                with self._lock:
+                    if self._alive == 0:
+                        RemotePool.log.error('No worker left for ' + installer.name)
+                        return False
+        try:
+            success = worker.install(installer, name, params)
+        except (IOError, OSError, ValueError) as err:
+            RemotePool.log.error('Worker ' + worker.address + ' failed on ' + installer.name + ': ' + str(err))
+            # The connection is broken, the worker is not used anymore.
+            with self._lock:
+                self._alive -= 1
+            return False
+        self._idle.put(worker)
+        return success
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
@@ -0,0 +1,200 @@
+__author__ = 'Christof Pieloth'
+
+import collections
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import logging
+
+from packbacker.errors import DependencyError
+
+
+class Scheduler(object):
+    """Executes the installers of a job concurrently in the order given by their dependencies."""
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, installers, workers=1):
+        Scheduler.check_dependencies(installers)
+        self._installers = list(installers)
+        self._workers = max(1, workers)
+
+    @property
+    def workers(self):
+        """Maximum number of installers which are executed at the same time."""
+        return self._workers
+
+    @staticmethod
+    def order(installers):
+        """Returns the installers in the order of their dependencies, otherwise in the order of the job."""
+        names = Scheduler.check_dependencies(installers)
+        return sorted(installers, key=lambda i: names.index(i.name))
+
+    @staticmethod
+    def check_dependencies(installers):
+        """
+        Raises a DependencyError, if a dependency is missing or the dependencies contain a cycle.
+        Returns the names of the installers in the order of their dependencies.
+        """
+        depends = collections.OrderedDict()
+        for i in installers:
+            depends.setdefault(i.name, set()).update(i.arg_depends)
+
+        for name, names in depends.items():
+            for d in names:
+                if d not in depends:
+                    raise DependencyError("'" + name + "' depends on unknown installer '" + d + "'")
+
+        # Kahn's algorithm: remove installers without open dependencies until nothing is left.
+        remaining = collections.OrderedDict((name, set(names)) for name, names in depends.items())
+        ordered = []
+        while remaining:
+            ready = [name for name, names in remaining.items() if not names]
+            if not ready:
+                raise DependencyError('Cyclic dependencies between: ' + ', '.join(sorted(remaining)))
+            for name in ready:
+                del remaining[name]
+            for names in remaining.values():
+                names.difference_update(ready)
+            ordered.extend(ready)
+        return ordered
+
+    def run(self, execute):
+        """
+        Calls execute(installer) for each installer as soon as its dependencies are finished.
+        execute must return True on success. Installers depending on a failed one are skipped.
+        Returns the number of failed and skipped installers.
+        """
+        if self._workers == 1:
+            return self._run_sequential(execute)
+        else:
+            return self._run_concurrent(execute)
+
+    def _run_sequential(self, execute):
+        errors = 0
+        progress = _Progress(self._installers)
+        while True:
+            ready, skipped = progress.take_ready()
+            errors += len(skipped)
+            if not ready:
+                break
+            for i in ready:
+                success = Scheduler._call(execute, i)
+                if not success:
+                    errors += 1
+                progress.finish(i, success)
+        return errors
+
+    def _run_concurrent(self, execute):
+        errors = 0
+        progress = _Progress(self._installers)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            while True:
+                ready, skipped = progress.take_ready()
+                errors += len(skipped)
+                for i in ready:
+                    Scheduler.log.debug('Scheduling ' + i.name)
+                    running[pool.submit(Scheduler._call, execute, i)] = i
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    success = future.result()
+                    if not success:
+                        errors += 1
+                    progress.finish(i, success)
+        return errors
+
+    def run_pipelined(self, fetch, build, fetch_workers):
+        """
+        Calls fetch(installer) for all installers in a pool of fetch_workers, independent of the dependencies.
+        build(installer) is called in a pool of workers, as soon as the installer is fetched and its dependencies
+        are finished. So downloads overlap with the compile steps of the installers before.
+        Returns the number of failed and skipped installers.
+        """
+        errors = 0
+        progress = _Progress(self._installers)
+        fetched = {}
+        waiting = []  # Dependencies are finished, but not fetched yet.
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as fetch_pool, \
+                ThreadPoolExecutor(max_workers=self._workers) as build_pool:
+            for i in self._installers:
+                running[fetch_pool.submit(Scheduler._call, fetch, i)] = (i, fetch)
+            while True:
+                ready, skipped = progress.take_ready()
+                errors += len(skipped)
+                waiting.extend(ready)
+
+                failed = False
+                for i in [w for w in waiting if w in fetched]:
+                    waiting.remove(i)
+                    if fetched[i]:
+                        Scheduler.log.debug('Scheduling build of ' + i.name)
+                        running[build_pool.submit(Scheduler._call, build, i)] = (i, build)
+                    else:
+                        errors += 1
+                        progress.finish(i, False)
+                        failed = True
+                if failed:
+                    # Dependent installers must be skipped.
+                    continue
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i, stage = running.pop(future)
+                    success = future.result()
+                    if stage is fetch:
+                        fetched[i] = success
+                    else:
+                        if not success:
+                            errors += 1
+                        progress.finish(i, success)
+        return errors
+
+    @staticmethod
+    def _call(execute, installer):
+        try:
+            return execute(installer)
+        except Exception as ex:
+            Scheduler.log.error('Unknown error on executing ' + installer.name + ':\n' + str(ex))
+            return False
+
+
+class _Progress(object):
+    """Bookkeeping of pending, unfinished and failed installers for the Scheduler."""
+
+    def __init__(self, installers):
+        self._pending = list(installers)
+        self._unfinished = collections.Counter(i.name for i in installers)
+        self._failed = set()
+
+    def take_ready(self):
+        """Removes and returns the installers which can be started and the ones which must be skipped."""
+        ready = []
+        skipped = []
+        changed = True
+        while changed:
+            changed = False
+            for i in list(self._pending):
+                failed = [d for d in i.arg_depends if d in self._failed]
+                if failed:
+                    Scheduler.log.error("Skipping '" + i.name + "', failed dependencies: " + ', '.join(failed))
+                    self._pending.remove(i)
+                    skipped.append(i)
+                    self.finish(i, False)
+                    changed = True
+                elif all(self._unfinished[d] == 0 for d in i.arg_depends):
+                    self._pending.remove(i)
+                    ready.append(i)
+        return ready, skipped
+
+    def finish(self, installer, success):
+        self._unfinished[installer.name] -= 1
+        if not success:
+            self._failed.add(installer.name)
@@ -0,0 +1,118 @@
+__author__ = 'Christof Pieloth'
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+
+Tool = collections.namedtuple('Tool', ['name', 'path', 'version'])
+
+
+class Toolchain(object):
+    """
+    Finds the programs, which are used by the installers, and their versions, e.g. as input for cache keys.
+    Each program is probed once per process. The versions are cached on disk by path and modification time.
+    """
+
+    log = logging.getLogger(__name__)
+
+    MAX_WORKERS = 8
+    TIMEOUT = 10  # seconds for 'program --version'
+
+    enabled = True
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'packbacker', 'toolchain.json')
+
+    _tools = {}  # name -> Tool or None if not found
+    _lock = threading.Lock()
+
+    @staticmethod
+    def probe(names):
+        """Finds the programs and queries the versions of the unknown ones in parallel."""
+        with Toolchain._lock:
+            names = [n for n in collections.OrderedDict.fromkeys(names) if n not in Toolchain._tools]
+            if not names:
+                return
+            paths = dict((n, shutil.which(n)) for n in names)
+            cache = Toolchain._read_cache()
+            stats = {}
+            queries = []
+            for n in names:
+                if paths[n] is None:
+                    Toolchain._tools[n] = None
+                    continue
+                real_path = os.path.realpath(paths[n])
+                st = os.stat(real_path)
+                stats[real_path] = {'mtime': st.st_mtime_ns, 'size': st.st_size}
+                entry = cache.get(real_path)
+                if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                    Toolchain._tools[n] = Tool(n, paths[n], entry['version'])
+                else:
+                    queries.append(n)
+
+            if queries:
+                with ThreadPoolExecutor(max_workers=min(len(queries), Toolchain.MAX_WORKERS)) as pool:
+                    versions = list(pool.map(lambda n: Toolchain._query_version(paths[n]), queries))
+                for n, version in zip(queries, versions):
+                    Toolchain._tools[n] = Tool(n, paths[n], version)
+                    real_path = os.path.realpath(paths[n])
+                    cache[real_path] = dict(stats[real_path], version=version)
+                Toolchain._write_cache(cache)
+
+    @staticmethod
+    def find(name):
+        """Returns the Tool of the program or None if it is not found."""
+        if name not in Toolchain._tools:
+            Toolchain.probe([name])
+        return Toolchain._tools[name]
+
+    @staticmethod
+    def check(name):
+        """Checks if the program is available, logs an error if not."""
+        if Toolchain.find(name) is None:
+            Toolchain.log.error("Could not found: " + name)
+            return False
+        return True
+
+    @staticmethod
+    def version(name):
+        """Returns the first line of 'program --version' or None if not found."""
+        tool = Toolchain.find(name)
+        return tool.version if tool else None
+
+    @staticmethod
+    def _query_version(path):
+        try:
+            out = subprocess.check_output([path, '--version'], stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                          timeout=Toolchain.TIMEOUT)
+            return out.decode('utf-8', 'replace').strip().split('\n')[0]
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            return None
+
+    @staticmethod
+    def _read_cache():
+        if not Toolchain.enabled:
+            return {}
+        try:
+            with open(Toolchain.path, 'r') as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_cache(cache):
+        if not Toolchain.enabled:
+            return
+        tmp_path = Toolchain.path + '.tmp-' + str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(Toolchain.path), exist_ok=True)
+            with open(tmp_path, 'w') as fd:
+                json.dump(cache, fd, indent=2, sort_keys=True)
+            os.replace(tmp_path, Toolchain.path)
+        except (IOError, OSError) as err:
+            Toolchain.log.warning('Could not write toolchain cache ' + Toolchain.path + ': ' + str(err))
@@ -0,0 +1,87 @@
+__author__ = 'Christof Pieloth'
+
+import json
+import logging
+import os
+import resource
+import threading
+import time
+
+
+class Span(object):
+    """A running installation or step of a Trace."""
+
+    def __init__(self, name, category, installer):
+        self.name = name
+        self.category = category
+        self.installer = installer
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+class Trace(object):
+    """
+    Records wall time, CPU time of child processes and status of installations and steps.
+    The events are written in the Chrome trace-event format, e.g. for chrome://tracing or https://ui.perfetto.dev.
+    CPU times are taken from all child processes, so they overlap if installers are executed concurrently.
+    """
+
+    log = logging.getLogger(__name__)
+
+    CATEGORY_INSTALL = 'install'
+    CATEGORY_STEP = 'step'
+
+    enabled = False
+
+    _events = []
+    _threads = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def begin(name, category, installer):
+        """Starts a span, returns None if tracing is disabled."""
+        if not Trace.enabled:
+            return None
+        return Span(name, category, installer)
+
+    @staticmethod
+    def end(span, success):
+        """Finishes the span and records it as event."""
+        if span is None:
+            return
+        end = time.time()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': int(span.start * 1e6),
+            'dur': int((end - span.start) * 1e6),
+            'pid': os.getpid(),
+            'args': {
+                'installer': span.installer,
+                'success': bool(success),
+                'children_user_time': round(children.ru_utime - span.children.ru_utime, 3),
+                'children_system_time': round(children.ru_stime - span.children.ru_stime, 3),
+            }
+        }
+        with Trace._lock:
+            event['tid'] = Trace._threads.setdefault(span.thread, len(Trace._threads) + 1)
+            Trace._events.append(event)
+
+    @staticmethod
+    def write(fname):
+        """Writes the recorded events as Chrome trace-event file."""
+        with Trace._lock:
+            events = list(Trace._events)
+            for thread, tid in Trace._threads.items():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                               'args': {'name': thread}})
+        try:
+            with open(fname, 'w') as fd:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fd, indent=1)
+        except IOError as err:
+            Trace.log.error('Could not write trace ' + fname + ': ' + str(err))
+            return False
+        return True
@@ -1,39 +1,58 @@
 __author__ = 'Christof Pieloth'
 
+import hashlib
 import logging
-import subprocess
+import threading
+
+from packbacker.progress import Progress
 
 
 class Utils:
     log = logging.getLogger(__name__)
 
     @staticmethod
-    def check_program(program, arg):
-        try:
-            subprocess.call([program, arg], stdout=subprocess.PIPE)
-            return True
-        except OSError:
-            Utils.log.error("Could not found: " + program)
-            return False
+    def digest(*values):
+        """Returns a SHA-256 hex digest of the values, e.g. to fingerprint the inputs of a build step."""
+        sha = hashlib.sha256()
+        for v in values:
+            sha.update(repr(v).encode('utf-8'))
+            sha.update(b'\0')
+        return sha.hexdigest()
 
 
 class UtilsUI:
     COLUMNS_INSTALL = 80
     COLUMNS_STEP = 40
 
+    # If False, no questions are asked and the defaults are used (batch mode).
+    interactive = True
+
+    # Serializes questions of concurrently running installers.
+    _input_lock = threading.Lock()
+
     @staticmethod
-    def ask_for_execute(action):
-        var = input(action + " y/n? ")
+    def ask_for_execute(action, default=True):
+        if not UtilsUI.interactive:
+            UtilsUI.print(action + " y/n? " + ('y' if default else 'n'))
+            return default
+
+        with UtilsUI._input_lock, Progress.paused():
+            var = input(action + " y/n? ")
         if var.startswith('y'):
             return True
         else:
             return False
 
     @staticmethod
-    def ask_for_make_jobs():
-        jobs = 2
+    def ask_for_make_jobs(default=2):
+        jobs = default
+        if not UtilsUI.interactive:
+            UtilsUI.print("Using job=" + str(jobs))
+            return jobs
+
         try:
-            jobs = int(input("Number of jobs (default: 2): "))
+            with UtilsUI._input_lock, Progress.paused():
+                jobs = int(input("Number of jobs (default: " + str(default) + "): "))
         except ValueError:
             UtilsUI.print_error("Wrong input format.")
         if jobs < 1:
@@ -43,48 +62,55 @@ class UtilsUI:
 
     @staticmethod
     def print_install_begin(dep_name):
-        UtilsUI.print('=' * UtilsUI.COLUMNS_INSTALL)
+        UtilsUI.print_separator('=', UtilsUI.COLUMNS_INSTALL)
         UtilsUI.print(dep_name)
-        UtilsUI.print('-' * UtilsUI.COLUMNS_INSTALL)
+        UtilsUI.print_separator('-', UtilsUI.COLUMNS_INSTALL)
 
     @staticmethod
     def print_install_end(dep_name):
-        UtilsUI.print('-' * UtilsUI.COLUMNS_INSTALL)
+        if Progress.compact():
+            # The result is printed at the end of the progress task.
+            return
+        UtilsUI.print_separator('-', UtilsUI.COLUMNS_INSTALL)
         UtilsUI.print(dep_name)
-        UtilsUI.print('=' * UtilsUI.COLUMNS_INSTALL)
+        UtilsUI.print_separator('=', UtilsUI.COLUMNS_INSTALL)
 
     @staticmethod
     def print_step_begin(action_str):
         info = action_str + " ..."
         UtilsUI.print(info)
-        UtilsUI.print('-' * UtilsUI.COLUMNS_STEP)
+        UtilsUI.print_separator('-', UtilsUI.COLUMNS_STEP)
 
     @staticmethod
     def print_step_end(action_str):
         info = action_str + " ... finished!"
-        UtilsUI.print('-' * UtilsUI.COLUMNS_STEP)
+        UtilsUI.print_separator('-', UtilsUI.COLUMNS_STEP)
         UtilsUI.print(info)
 
+    @staticmethod
+    def print_separator(char, columns):
+        """Prints a separator line, which is omitted in the compact output of concurrent installers."""
+        if not Progress.compact():
+            UtilsUI.print(char * columns)
+
     @staticmethod
     def print_env_var(name_env, value=None):
         if value is None:
             if len(name_env) == 1:
-                UtilsUI.print('Environment variable to set:')
+                lines = ['Environment variable to set:', '']
             else:
-                UtilsUI.print('Environment variables to set:')
-            UtilsUI.print()
+                lines = ['Environment variables to set:', '']
             for name, value in name_env.items():
-                UtilsUI.print(name + "=" + value)
+                lines.append(name + "=" + value)
         else:
-            UtilsUI.print('Environment variable to set:')
-            UtilsUI.print()
-            UtilsUI.print(name_env + "=" + value)
-        UtilsUI.print()
+            lines = ['Environment variable to set:', '', name_env + "=" + value]
+        # Shown in the live progress view, too.
+        Progress.write('\n'.join(lines) + '\n', True)
 
     @staticmethod
     def print(*args):
-        print(*args)
+        Progress.write(' '.join(str(a) for a in args))
 
     @staticmethod
     def print_error(*args):
-        print(*args)
\ No newline at end of file
+        Progress.write(' '.join(str(a) for a in args), True)
\ No newline at end of file
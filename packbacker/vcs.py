@@ -0,0 +1,348 @@
+__author__ = 'Christof Pieloth'
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+from subprocess import check_output
+from subprocess import CalledProcessError
+from subprocess import DEVNULL
+import threading
+
+from packbacker.command import Command
+from packbacker.destination import Staging
+from packbacker.utils import UtilsUI
+
+
+class MirrorCache(object):
+    """Local mirrors of remote repositories. Clones of a known URL only fetch the changes from the remote."""
+
+    log = logging.getLogger(__name__)
+
+    # Full commit ID of git (SHA-1) and hg, which can not be moved like a tag or branch.
+    COMMIT_ID = re.compile(r'^[0-9a-f]{40}$')
+
+    enabled = True
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'packbacker', 'mirrors')
+
+    hits = 0
+    misses = 0
+
+    _lock = threading.Lock()
+    _url_locks = {}
+    _updated = set()  # mirrors which are up to date in this process
+
+    @staticmethod
+    def mirror_dir(url):
+        """Returns the folder of the mirror for the URL."""
+        name = re.sub(r'[^\w.-]+', '_', url.rstrip('/').split('/')[-1]) or 'repo'
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(MirrorCache.path, name + '-' + digest)
+
+    @staticmethod
+    def update_git(url, revision=None):
+        """
+        Creates or updates the git mirror of the URL. Returns the mirror folder or None on errors.
+        The remote is not contacted, if the revision is a commit ID, which is already in the mirror.
+        """
+        return MirrorCache.__update(url, revision, ['git', 'clone', '--mirror', '--quiet', url],
+                                    ['git', '--git-dir', '{mirror}', 'remote', 'update', '--prune'],
+                                    ['git', '--git-dir', '{mirror}', 'cat-file', '-e', '{revision}^{{commit}}'])
+
+    @staticmethod
+    def update_hg(url, revision=None):
+        """
+        Creates or updates the hg mirror of the URL. Returns the mirror folder or None on errors.
+        The remote is not contacted, if the revision is a commit ID, which is already in the mirror.
+        """
+        return MirrorCache.__update(url, revision, ['hg', 'clone', '--noupdate', url],
+                                    ['hg', 'pull', '--repository', '{mirror}', url],
+                                    ['hg', 'log', '--repository', '{mirror}', '--rev', '{revision}', '--template', ''])
+
+    @staticmethod
+    def print_statistics():
+        if MirrorCache.hits + MirrorCache.misses == 0:
+            return
+        UtilsUI.print('Mirror cache ' + MirrorCache.path + ': ' + str(MirrorCache.hits) + ' hits, ' +
+                      str(MirrorCache.misses) + ' misses')
+
+    @staticmethod
+    def __update(url, revision, clone_cmd, update_cmd, contains_cmd):
+        mirror = MirrorCache.mirror_dir(url)
+        with MirrorCache.url_lock(url):
+            if os.path.isdir(mirror):
+                MirrorCache.__count(hit=True)
+                if mirror in MirrorCache._updated:
+                    # E.g. several versions of an installer in one job.
+                    return mirror
+                if revision and MirrorCache.COMMIT_ID.match(revision) and \
+                        MirrorCache.__run_quiet([arg.format(mirror=mirror, revision=revision) for arg in contains_cmd]):
+                    MirrorCache.log.info('Revision ' + revision + ' is already in mirror: ' + mirror)
+                    return mirror
+                MirrorCache.log.info('Updating mirror: ' + mirror)
+                if Command.run([arg.format(mirror=mirror) for arg in update_cmd]) != 0:
+                    MirrorCache.log.warning('Could not update mirror: ' + mirror)
+                MirrorCache._updated.add(mirror)
+                return mirror
+
+            MirrorCache.__count(hit=False)
+            MirrorCache.log.info('Creating mirror: ' + mirror)
+            # Clone to a temporary folder first, so other processes never see an incomplete mirror.
+            tmp_mirror = mirror + '.tmp-' + str(os.getpid())
+            if os.path.isdir(tmp_mirror):
+                shutil.rmtree(tmp_mirror)
+            os.makedirs(MirrorCache.path, exist_ok=True)
+            if Command.run(clone_cmd + [tmp_mirror]) != 0:
+                MirrorCache.log.error('Could not create mirror for: ' + url)
+                shutil.rmtree(tmp_mirror, ignore_errors=True)
+                return None
+            try:
+                os.rename(tmp_mirror, mirror)
+            except OSError:
+                # Created by another process in the meantime.
+                shutil.rmtree(tmp_mirror, ignore_errors=True)
+            MirrorCache._updated.add(mirror)
+            return mirror
+
+    @staticmethod
+    def __run_quiet(cmd):
+        """Executes the command without output, e.g. a check. Returns True if it succeeds."""
+        try:
+            check_output(cmd, stderr=DEVNULL)
+            return True
+        except (OSError, CalledProcessError):
+            return False
+
+    @staticmethod
+    def __count(hit):
+        with MirrorCache._lock:
+            if hit:
+                MirrorCache.hits += 1
+            else:
+                MirrorCache.misses += 1
+
+    @staticmethod
+    def url_lock(url):
+        """Returns the lock, which serializes the changes of the mirror of the URL within this process."""
+        with MirrorCache._lock:
+            return MirrorCache._url_locks.setdefault(url, threading.Lock())
+
+
+class Git(object):
+    """
+    Git operations of the installers. The commands are executed with the context of the installer, the updates
+    of the shared mirror with the environment of this process.
+    """
+
+    log = logging.getLogger(__name__)
+
+    @staticmethod
+    def clone(ctx, url, repo_dir, revision=None):
+        """
+        Clones the repository, borrowing the objects from the local mirror if it is enabled.
+        The mirror is not updated, if it contains the revision already, see MirrorCache.update_git().
+        Raises a CommandError on errors.
+        """
+        mirror = MirrorCache.update_git(url, revision) if MirrorCache.enabled else None
+        if mirror:
+            def clone(path):
+                # The mirror is up to date, so the remote is not contacted again.
+                ctx.check(['git', 'clone', '--reference', mirror, mirror, path])
+                ctx.check(['git', '-C', path, 'remote', 'set-url', 'origin', url])
+
+            Staging.publish(repo_dir, clone)
+        else:
+            Staging.publish(repo_dir, lambda path: ctx.check(['git', 'clone', url, path]))
+
+    @staticmethod
+    def add_worktree(ctx, url, repo_dir, revision):
+        """
+        Checks out the revision as worktree of the local mirror, so several versions share one download.
+        Clones the repository if the mirror is disabled. Raises a CommandError on errors.
+        """
+        mirror = MirrorCache.update_git(url, revision) if MirrorCache.enabled else None
+        if not mirror:
+            Git.log.warning('Mirror cache is disabled, cloning instead of adding a worktree: ' + url)
+            Git.clone(ctx, url, repo_dir, revision)
+            return
+
+        def add(path):
+            ctx.check(['git', '--git-dir', mirror, 'worktree', 'add', '--detach', path, revision])
+
+        def move(path, repo_dir):
+            if os.path.isdir(repo_dir):
+                os.rmdir(repo_dir)
+            # The mirror knows the path of each worktree.
+            ctx.check(['git', '--git-dir', mirror, 'worktree', 'move', path, os.path.abspath(repo_dir)])
+
+        with MirrorCache.url_lock(url):
+            # Forgets the worktrees of deleted folders, e.g. of a previous installation.
+            ctx.check(['git', '--git-dir', mirror, 'worktree', 'prune'])
+            Staging.publish(repo_dir, add, move)
+
+    @staticmethod
+    def resolve(url, revisions):
+        """
+        Returns a dictionary revision -> commit ID for the tags, branches and commit IDs, None if unknown.
+        The refs of the remote are listed once, abbreviated commit IDs are looked up in the local mirror.
+        """
+        commits = dict((r, r) for r in revisions if MirrorCache.COMMIT_ID.match(r))
+        if len(commits) == len(revisions):
+            return commits
+
+        refs = {}
+        try:
+            env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+            out = check_output(['git', 'ls-remote', url], stdin=DEVNULL, stderr=DEVNULL, env=env)
+            for line in out.decode('utf-8', 'replace').splitlines():
+                commit, ref = line.split('\t', 1)
+                refs[ref] = commit
+        except (OSError, CalledProcessError, ValueError) as err:
+            Git.log.warning('Could not list the refs of ' + url + ': ' + str(err))
+
+        mirror = MirrorCache.mirror_dir(url)
+        for r in revisions:
+            if r in commits:
+                continue
+            # An annotated tag points to the tag object, ^{} to the commit.
+            for ref in ('refs/tags/' + r + '^{}', 'refs/tags/' + r, 'refs/heads/' + r, r):
+                if ref in refs:
+                    commits[r] = refs[ref]
+                    break
+            else:
+                commits[r] = Git.__rev_parse(mirror, r) if os.path.isdir(mirror) else None
+        return commits
+
+    @staticmethod
+    def __rev_parse(git_dir, revision):
+        try:
+            cmd = ['git', '--git-dir', git_dir, 'rev-parse', '--verify', '--quiet', revision + '^{commit}']
+            out = check_output(cmd, stderr=DEVNULL)
+            return out.decode('utf-8').strip()
+        except (OSError, CalledProcessError):
+            return None
+
+    @staticmethod
+    def commit_of(repo_dir, revision):
+        """Returns the commit ID of the revision in the local repository or None, the remote is not contacted."""
+        try:
+            cmd = ['git', '-C', repo_dir, 'rev-parse', '--verify', '--quiet', revision + '^{commit}']
+            out = check_output(cmd, stderr=DEVNULL)
+            return out.decode('utf-8').strip()
+        except (OSError, CalledProcessError):
+            return None
+
+    @staticmethod
+    def head_revision(repo_dir):
+        """Returns the SHA of the checked out revision or None, e.g. as input for cache keys."""
+        try:
+            out = check_output(['git', '-C', repo_dir, 'rev-parse', 'HEAD'], stderr=DEVNULL)
+            return out.decode('utf-8').strip()
+        except (OSError, CalledProcessError):
+            return None
+
+    @staticmethod
+    def fetch_revision(ctx, url, repo_dir, revision):
+        """
+        Fetches only the revision (SHA, tag or branch) without its history.
+        Fetches the full history, if the server refuses to send a single revision, e.g. an abbreviated SHA.
+        Raises a CommandError on errors.
+        """
+        if MirrorCache.COMMIT_ID.match(revision):
+            refspec = revision
+        else:
+            # Stores tags and branches as local tag, so they can be checked out by name.
+            refspec = '+' + revision + ':refs/tags/' + revision
+
+        def fetch(path):
+            ctx.check(['git', 'init', '--quiet', path])
+            ctx.check(['git', '-C', path, 'remote', 'add', 'origin', url])
+            if ctx.run(['git', '-C', path, 'fetch', '--depth', '1', 'origin', refspec]) != 0:
+                Git.log.warning('Shallow fetch of ' + revision + ' failed, fetching full history: ' + url)
+                ctx.check(['git', '-C', path, 'fetch', '--tags', 'origin'])
+
+        Staging.publish(repo_dir, fetch)
+
+
+class Hg(object):
+    """
+    Mercurial operations of the installers. The commands are executed with the context of the installer, the updates
+    of the shared mirror with the environment of this process.
+    """
+
+    log = logging.getLogger(__name__)
+
+    @staticmethod
+    def clone(ctx, url, repo_dir, revision=None):
+        """
+        Clones the repository from the local mirror if it is enabled, the default path stays the URL.
+        The mirror is not updated, if it contains the revision already, see MirrorCache.update_hg().
+        Raises a CommandError on errors.
+        """
+        mirror = MirrorCache.update_hg(url, revision) if MirrorCache.enabled else None
+        if not mirror:
+            Staging.publish(repo_dir, lambda path: ctx.check(['hg', 'clone', url, path]))
+            return
+
+        def clone(path):
+            ctx.check(['hg', 'clone', mirror, path])
+            with open(os.path.join(path, '.hg', 'hgrc'), 'w') as hgrc:
+                hgrc.write('[paths]\ndefault = ' + url + '\n')
+
+        Staging.publish(repo_dir, clone)
+
+    @staticmethod
+    def resolve(url, revisions):
+        """
+        Returns a dictionary revision -> commit ID for the tags, branches and commit IDs, None if unknown.
+        Revisions, which are unknown to the remote, are looked up in the local mirror.
+        """
+        mirror = MirrorCache.mirror_dir(url)
+        commits = {}
+        for r in revisions:
+            if MirrorCache.COMMIT_ID.match(r):
+                commits[r] = r
+                continue
+            commits[r] = Hg.__identify(['hg', 'identify', '--debug', '--rev', r, url])
+            if commits[r] is None and os.path.isdir(mirror):
+                commits[r] = Hg.__identify(['hg', 'identify', '--debug', '--rev', r, mirror])
+        return commits
+
+    @staticmethod
+    def __identify(cmd):
+        try:
+            out = check_output(cmd, stdin=DEVNULL, stderr=DEVNULL).decode('utf-8', 'replace').split()
+        except (OSError, CalledProcessError):
+            return None
+        return out[0] if out and MirrorCache.COMMIT_ID.match(out[0]) else None
+
+    @staticmethod
+    def commit_of(repo_dir, revision):
+        """Returns the commit ID of the revision in the local repository or None, the remote is not contacted."""
+        return Hg.__identify(['hg', 'log', '--repository', repo_dir, '--rev', revision, '--template', '{node}'])
+
+    @staticmethod
+    def share(ctx, url, repo_dir, revision=None):
+        """
+        Creates a working copy, which shares the store of the local mirror, so several versions share one download.
+        Clones the repository if the mirror is disabled. Raises a CommandError on errors.
+        """
+        mirror = MirrorCache.update_hg(url, revision) if MirrorCache.enabled else None
+        if not mirror:
+            Hg.log.warning('Mirror cache is disabled, cloning instead of sharing: ' + url)
+            Hg.clone(ctx, url, repo_dir, revision)
+            return
+
+        def share(path):
+            ctx.check(['hg', '--config', 'extensions.share=', 'share', '--noupdate', mirror, path])
+            with open(os.path.join(path, '.hg', 'hgrc'), 'w') as hgrc:
+                hgrc.write('[paths]\ndefault = ' + url + '\n')
+
+        Staging.publish(repo_dir, share)
+
+    @staticmethod
+    def fetch_revision(ctx, url, repo_dir, revision):
+        """Clones only the revision and its ancestors, hg does not support history-less clones."""
+        Staging.publish(repo_dir, lambda path: ctx.check(['hg', 'clone', '--rev', revision, url, path]))